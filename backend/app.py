@@ -3,6 +3,7 @@ import os
 import logging # Import logging
 import time    # Import time module for timestamps
 import random  # For probabilistic cache cleaning
+from collections import Counter
 from logging.handlers import RotatingFileHandler # For rotating logs
 from flask import Flask, jsonify, request, send_from_directory # Import request and send_from_directory
 from dotenv import load_dotenv
@@ -17,8 +18,19 @@ from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
 import cv2
 import numpy as np
-import mediapipe as mp
 from remove_bg import remove_background
+import remove_bg
+import pose_pool
+from pose_pool import torso_points
+from live_quality import LoadMonitor
+from garment_warp import GarmentTemplate, TemplateCache, landmark_transform, fit_box_transform, live_transform, warp_onto
+from asset_store import AssetStore, default_store_dir
+from ingest import ingest_upload, is_content_id, normalized_filename
+from video_tryon import process_video, VideoTryOnError
+from single_flight import SingleFlight, SingleFlightTimeout
+import result_cache
+from loadgen import SessionRecorder
+from profiler import RouteProfiler, ProfilerBusy, to_collapsed, save_profile, load_profile, prune_profiles, is_profile_id
 
 load_dotenv() # Load environment variables from .env
 
@@ -56,11 +68,44 @@ app.logger.info('Backend application starting up...') # Log startup
 # Define the upload folder and allowed extensions
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'webm', 'mkv'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# User uploads are normalized once at ingest: longest side capped, stored as JPEG
+UPLOAD_MAX_DIMENSION = int(os.getenv('UPLOAD_MAX_DIMENSION', 1280))
+UPLOAD_JPEG_QUALITY = int(os.getenv('UPLOAD_JPEG_QUALITY', 90))
+
+# Live try-on rate limit: at most this many frames per window per client IP
+LIVE_RATE_LIMIT_REQUESTS = int(os.getenv('LIVE_RATE_LIMIT_REQUESTS', 5))
+LIVE_RATE_LIMIT_WINDOW = float(os.getenv('LIVE_RATE_LIMIT_WINDOW', 2.0))
+# Per-frame latency the server aims for before asking clients to lower quality
+LIVE_TARGET_LATENCY_MS = int(os.getenv('LIVE_TARGET_LATENCY_MS', 250))
+
+# Tracks live try-on load so every response can carry a quality hint.
+# The interval floor is derived from the rate limit (plus a margin) so clients following the hint aren't throttled.
+live_load = LoadMonitor(
+    min_interval_ms=LIVE_RATE_LIMIT_WINDOW * 1000 / LIVE_RATE_LIMIT_REQUESTS,
+    target_latency_ms=LIVE_TARGET_LATENCY_MS
+)
+
+# Opt-in recording of live sessions for capacity testing (replay with `manage.py replay-sessions`).
+# Records every accepted webcam frame, so only enable it where users have agreed to that.
+LIVE_RECORD_DIR = os.getenv('LIVE_RECORD_DIR')
+live_recorder = SessionRecorder(LIVE_RECORD_DIR) if LIVE_RECORD_DIR else None
+
+# Concurrent cache misses for the same garment share one download + background removal.
+# Waiting requests give up after this many seconds.
+GARMENT_FETCH_WAIT_TIMEOUT = float(os.getenv('GARMENT_FETCH_WAIT_TIMEOUT', 30))
+garment_flights = SingleFlight()
+# Identical try-on requests arriving together render their result once
+result_flights = SingleFlight()
+
+# Warp-ready data for garments uploaded to this process (not shared across workers)
+garment_templates = TemplateCache(max_items=50)
+
 # Database Configuration
 # Set up SQLite database path and URI
 db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.sqlite')
@@ -68,6 +113,13 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
+# Warp-ready catalog garments, shared read-only by every worker process through memory-mapped files.
+# Keyed by item id, so the default location is namespaced by the database it belongs to.
+asset_store = AssetStore(
+    os.getenv('ASSET_STORE_DIR', default_store_dir(db_path)),
+    max_items=int(os.getenv('ASSET_STORE_MAX_ITEMS', 500))
+)
+
 # --- Flask-Admin Configuration ---
 # --- Database Models ---
 class ClothingItem(db.Model):
@@ -98,9 +150,61 @@ admin.add_view(ModelView(ClothingItem, db.session))
 # -----------------------------
 
 # --- Helper Function ---
-def allowed_file(filename):
+def allowed_file(filename, extensions=ALLOWED_EXTENSIONS):
     return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+           filename.rsplit('.', 1)[1].lower() in extensions
+
+def fetch_clothing_image(image_url, timeout=15):
+    """Downloads a garment image and removes its background, returning an RGBA Pillow image."""
+    response = requests.get(image_url, stream=True, timeout=timeout)
+    response.raise_for_status()
+    clothing_img = Image.open(io.BytesIO(response.content)).convert("RGBA")
+    return remove_background(clothing_img)
+
+def get_garment_template(clothing_item, timeout=10):
+    """
+    Returns (cache_key, GarmentTemplate) for a catalog item from the shared asset store,
+    downloading, removing the background and publishing it only on a miss (or when the
+    item's imageUrl changed). Concurrent misses for the same item wait on a single
+    download, across threads (single flight) and worker processes (the store's key
+    lock). Raises requests exceptions on download failure and SingleFlightTimeout
+    if another request's download takes too long.
+    """
+    cache_key = f"clothing_{clothing_item.id}"
+    source = clothing_item.imageUrl
+    template = asset_store.get(cache_key, source)
+    if template is not None:
+        return cache_key, template
+
+    def load():
+        try:
+            with asset_store.key_lock(cache_key, timeout=GARMENT_FETCH_WAIT_TIMEOUT):
+                # Another worker may have published it while this one waited for the lock
+                published = asset_store.get(cache_key, source)
+                if published is not None:
+                    return published
+                clothing_img = fetch_clothing_image(source, timeout=timeout)
+                app.logger.info(f"Publishing garment for item {clothing_item.id} to the asset store")
+                return asset_store.publish(cache_key, GarmentTemplate(np.array(clothing_img.convert("RGBA"))), source)
+        except TimeoutError as e:
+            raise SingleFlightTimeout(str(e)) from e
+
+    return cache_key, garment_flights.do(cache_key, load, timeout=GARMENT_FETCH_WAIT_TIMEOUT)
+def clean_old_results(prefix, keep):
+    """
+    Deletes all but the newest `keep` result files whose names start with prefix
+    (result names embed their creation time). Returns how many are left.
+    """
+    upload_dir = app.config['UPLOAD_FOLDER']
+    try:
+        # Find and remove old result files
+        result_files = sorted(f for f in os.listdir(upload_dir) if f.startswith(prefix))
+        for old_file in result_files[:-keep]:
+            os.remove(os.path.join(upload_dir, old_file))
+        return min(len(result_files), keep)
+    except Exception as cleanup_err:
+        app.logger.error(f"Error cleaning up old files: {cleanup_err}")
+        return keep
 # ---------------------
 
 # Dummy data (keep for now, maybe for seeding later)
@@ -113,6 +217,18 @@ def allowed_file(filename):
 def hello_world():
     return jsonify(message="Hello from Flask Backend!")
 
+# GET /api/ready - Readiness check: are the models in this worker warm?
+@app.route("/api/ready")
+def readiness():
+    poses = pose_pool.status()
+    ready = remove_bg.is_loaded() and all(p["created"] > 0 for p in poses.values())
+    return jsonify({
+        "ready": ready,
+        "pid": os.getpid(),
+        "models": {"rembg": remove_bg.is_loaded(), "pose": poses},
+        "catalogAssets": len(asset_store)
+    }), 200 if ready else 503
+
 # --- NEW BRANDS ENDPOINT ---
 # GET /api/brands - Retrieve a unique, sorted list of brands
 @app.route('/api/brands')
@@ -178,16 +294,20 @@ def upload_user_image():
 
     if file and allowed_file(file.filename):
         try:
-            filename = secure_filename(file.filename) # Sanitize filename
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(save_path)
-            print(f"File saved successfully: {save_path}") # Log success
-            # In a real app, you might save the filename/path to the DB
-            # or return a unique identifier/URL (especially if using S3 later)
+            # Stream, hash and normalize; identical photos map to the same stored file
+            content_id, filename, deduplicated = ingest_upload(
+                file, app.config['UPLOAD_FOLDER'],
+                max_dimension=UPLOAD_MAX_DIMENSION, jpeg_quality=UPLOAD_JPEG_QUALITY
+            )
+            app.logger.info(f"Upload {content_id} stored as {filename} (deduplicated: {deduplicated})")
             return jsonify({
-                "message": f"File '{filename}' uploaded successfully.",
-                "filename": filename # Return the saved filename
+                "message": f"File '{secure_filename(file.filename)}' uploaded successfully.",
+                "contentId": content_id,
+                "filename": filename # Name of the normalized image on the server
                 }), 200
+        except ValueError as e:
+            app.logger.warning(f"Rejected upload: {e}")
+            return jsonify({"error": "Uploaded file is not a valid image"}), 400
         except Exception as e:
             print(f"Error saving file: {e}") # Log the exception
             return jsonify({"error": "Failed to save file on server"}), 500
@@ -200,7 +320,7 @@ def upload_user_image():
 def process_tryon():
     """
     Processes a virtual try-on request using MediaPipe for pose detection and Pillow for compositing.
-    Expects JSON body with 'userImageFilename' and either 'clothingImageUrl' (preferred) or 'clothingItemId'.
+    Expects JSON body with 'userImageId' (or 'userImageFilename') and either 'clothingImageUrl' (preferred) or 'clothingItemId'.
     Returns a result image URL.
     """
     if not request.is_json:
@@ -208,11 +328,16 @@ def process_tryon():
 
     data = request.get_json()
     user_image_filename = data.get('userImageFilename')
+    user_image_id = data.get('userImageId')
+    if user_image_id:
+        if not is_content_id(user_image_id):
+            return jsonify({"error": "Invalid 'userImageId'"}), 400
+        user_image_filename = normalized_filename(user_image_id)
     clothing_image_url = data.get('clothingImageUrl')
     clothing_item_id = data.get('clothingItemId')
 
     if not user_image_filename or (not clothing_image_url and not clothing_item_id):
-        return jsonify({"error": "Missing 'userImageFilename' and either 'clothingImageUrl' or 'clothingItemId' in request body"}), 400
+        return jsonify({"error": "Missing 'userImageId' (or 'userImageFilename') and either 'clothingImageUrl' or 'clothingItemId' in request body"}), 400
 
     try:
         user_image_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(user_image_filename))
@@ -220,80 +345,84 @@ def process_tryon():
             return jsonify({"error": f"User image '{user_image_filename}' not found on server"}), 404
 
         # --- Get clothing image ---
-        clothing_img = None
+        # Only the garment's digest is needed to look up a cached result; the
+        # warp-ready template is loaded when the result actually has to be rendered
         if clothing_image_url and clothing_image_url.startswith('/uploads/'):
-            # Use local file from uploads
+            # Use local file from uploads, identified by its content
             clothing_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(clothing_image_url))
             if not os.path.exists(clothing_path):
                 return jsonify({"error": f"Clothing image '{clothing_image_url}' not found on server"}), 404
-            clothing_img = Image.open(clothing_path).convert("RGBA")
+            garment_digest = result_cache.file_digest(clothing_path)
+            get_template = lambda: garment_templates.get(f"upload_{garment_digest}", lambda: Image.open(clothing_path))
         elif clothing_item_id:
             clothing_item = ClothingItem.query.get(clothing_item_id)
             if not clothing_item or not clothing_item.imageUrl:
                 return jsonify({"error": f"Clothing item with ID {clothing_item_id} not found or missing imageUrl"}), 404
-            response = requests.get(clothing_item.imageUrl, stream=True, timeout=15)
-            response.raise_for_status()
-            clothing_img = Image.open(io.BytesIO(response.content)).convert("RGBA")
-            clothing_img = remove_background(clothing_img)
+            # Catalog garments are memory-mapped from the asset store, which records their digest
+            _, catalog_template = get_garment_template(clothing_item, timeout=15)
+            garment_digest = catalog_template.digest
+            get_template = lambda: catalog_template
         else:
             return jsonify({"error": "No valid clothing image source provided."}), 400
 
-        # Load user image
-        user_img = Image.open(user_image_path).convert("RGBA")
-        user_img_np = np.array(user_img)
-        user_img_rgb = cv2.cvtColor(user_img_np, cv2.COLOR_RGBA2RGB)
+        # Results are named after what they are made of (user image, garment, pipeline
+        # version), so a repeat request is answered from disk and a changed input never
+        # returns a stale result
+        result_filename = result_cache.result_filename(result_cache.file_digest(user_image_path), garment_digest)
+        result_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
+        result_url = f"/uploads/{result_filename}"
+        if os.path.exists(result_path):
+            return jsonify({
+                "message": "Try-on generated successfully.",
+                "resultImageUrl": result_url,
+                "cached": True
+                }), 200
+
+        def render():
+            # Another request may have rendered it while this one waited
+            if os.path.exists(result_path):
+                return True
+
+            # Load user image
+            user_img = Image.open(user_image_path).convert("RGBA")
+            user_img_np = np.array(user_img)
+            user_img_rgb = cv2.cvtColor(user_img_np, cv2.COLOR_RGBA2RGB)
 
-        # MediaPipe pose detection
-        mp_pose = mp.solutions.pose
-        with mp_pose.Pose(static_image_mode=True, model_complexity=1, enable_segmentation=False) as pose:
-            results = pose.process(user_img_rgb)
+            # MediaPipe pose detection
+            # Reuse a warm pose graph instead of building one per request
+            with pose_pool.get_pool('photo').acquire() as pose:
+                results = pose.process(user_img_rgb)
             if not results.pose_landmarks:
-                return jsonify({"error": "Could not detect pose landmarks in user image."}), 422
-
-            # Extract key landmarks
-            lm = results.pose_landmarks.landmark
-            left_shoulder = lm[mp_pose.PoseLandmark.LEFT_SHOULDER]
-            right_shoulder = lm[mp_pose.PoseLandmark.RIGHT_SHOULDER]
-            left_hip = lm[mp_pose.PoseLandmark.LEFT_HIP]
-            right_hip = lm[mp_pose.PoseLandmark.RIGHT_HIP]
-            # Use image size to get pixel coordinates
+                return False
+
+            # Map the garment's shoulder/hip anchors onto the detected landmarks
+            template = get_template()
             h, w, _ = user_img_rgb.shape
-            x1, y1 = int(left_shoulder.x * w), int(left_shoulder.y * h)
-            x2, y2 = int(right_shoulder.x * w), int(right_shoulder.y * h)
-            x3, y3 = int(left_hip.x * w), int(left_hip.y * h)
-            x4, y4 = int(right_hip.x * w), int(right_hip.y * h)
-            # Compute bounding box for torso
-            min_x = min(x1, x2, x3, x4)
-            max_x = max(x1, x2, x3, x4)
-            min_y = min(y1, y2)
-            max_y = max(y3, y4)
-            box_width = max_x - min_x
-            box_height = max_y - min_y
-            # Resize clothing image to fit the bounding box
-            aspect = clothing_img.height / clothing_img.width
-            target_width = box_width
-            target_height = int(target_width * aspect)
-            if target_height > box_height:
-                target_height = box_height
-                target_width = int(target_height / aspect)
-            clothing_resized = clothing_img.resize((target_width, target_height), Image.LANCZOS)
-            # Center clothing horizontally in the box, align top to min_y
-            paste_x = min_x + (box_width - target_width) // 2
-            paste_y = min_y
+            points = torso_points(results.pose_landmarks.landmark, w, h)
+            matrix = landmark_transform(template, points)
+            if matrix is None:
+                # Degenerate pose (e.g. side-on); fall back to fitting the torso bounding box
+                xs = [p[0] for p in points]
+                ys = [p[1] for p in points]
+                matrix = fit_box_transform(template, (min(xs), min(ys[:2]), max(xs), max(ys[2:])))
             # Composite
-            result_img = user_img.copy()
-            result_img.paste(clothing_resized, (paste_x, paste_y), mask=clothing_resized)
+            result_img = Image.fromarray(warp_onto(user_img_np, template, matrix))
 
-        # Save result
-        result_filename = f"tryon_{os.path.splitext(user_image_filename)[0]}_{os.path.basename(clothing_image_url) if clothing_image_url else clothing_item_id}.png"
-        result_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
-        result_img.save(result_path)
-        result_url = f"/uploads/{result_filename}"
+            # Save result; written under a temporary name so it is never served half-written
+            result_cache.save_atomic(result_img, result_path, format="PNG")
+            return True
+
+        if not result_flights.do(result_filename, render):
+            return jsonify({"error": "Could not detect pose landmarks in user image."}), 422
         return jsonify({
             "message": "Try-on generated successfully.",
-            "resultImageUrl": result_url
+            "resultImageUrl": result_url,
+            "cached": False
             }), 200
 
+    except SingleFlightTimeout as e:
+        app.logger.warning(f"Gave up waiting for clothing image: {e}")
+        return jsonify({"error": "Clothing image is still being prepared, please retry"}), 503
     except Exception as e:
         print(f"Error during try-on processing: {e}")
         return jsonify({"error": "An internal error occurred during try-on processing"}), 500
@@ -308,16 +437,19 @@ def remove_bg_endpoint():
         return jsonify({"error": "Missing imageUrl"}), 400
 
     try:
-        response = requests.get(image_url, stream=True, timeout=15)
-        response.raise_for_status()
-        img = Image.open(io.BytesIO(response.content)).convert("RGBA")
-        img_no_bg = remove_background(img)
-
-        # Save and return the new image URL
         filename = f"nobg_{os.path.splitext(os.path.basename(image_url).split('?')[0])[0]}.png"
         save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        img_no_bg.save(save_path, format="PNG")
-        return jsonify({"resultImageUrl": f"/uploads/{filename}"})
+
+        def remove_and_save():
+            img_no_bg = fetch_clothing_image(image_url)
+            # Renamed into place, so a concurrent reader never sees a partial PNG
+            result_cache.save_atomic(img_no_bg, save_path, format="PNG")
+            return f"/uploads/{filename}"
+
+        # Concurrent requests for the same URL share one download, background removal
+        # and save; waiting requests only get the URL back
+        result_url = garment_flights.do(f"url_{image_url}", remove_and_save, timeout=GARMENT_FETCH_WAIT_TIMEOUT)
+        return jsonify({"resultImageUrl": result_url})
     except Exception as e:
         return jsonify({"error": f"Failed to remove background: {str(e)}"}), 500
 # -------------------------
@@ -337,8 +469,14 @@ def process_live_tryon():
     """
     Processes a live webcam frame for virtual try-on.
     Expects 'frame' (image file) and 'clothingItemId' in multipart/form-data.
-    Returns a processed image with clothing overlaid.
+    Returns a processed image with clothing overlaid, plus a 'qualityHint'
+    telling the client which resolution, JPEG quality and frame interval to use next.
     """
+    # Count this request towards the queue depth reported in quality hints
+    with live_load.track():
+        return _handle_live_tryon()
+
+def _handle_live_tryon():
     # Initialize time tracking for performance monitoring
     start_time = time.time()
     
@@ -351,12 +489,15 @@ def process_live_tryon():
     if not hasattr(app, 'rate_limit_store'):
         app.rate_limit_store = {}
     
-    # If more than 5 requests in 2 seconds from same IP, throttle
+    # If more than LIVE_RATE_LIMIT_REQUESTS requests in LIVE_RATE_LIMIT_WINDOW seconds from same IP, throttle
     if client_ip in app.rate_limit_store:
-        requests_history = [t for t in app.rate_limit_store[client_ip] if current_time - t < 2.0]
-        if len(requests_history) >= 5:
+        requests_history = [t for t in app.rate_limit_store[client_ip] if current_time - t < LIVE_RATE_LIMIT_WINDOW]
+        if len(requests_history) >= LIVE_RATE_LIMIT_REQUESTS:
             app.logger.warning(f"Rate limiting applied to {client_ip}")
-            return jsonify({"error": "Too many requests. Please slow down."}), 429
+            return jsonify({
+                "error": "Too many requests. Please slow down.",
+                "qualityHint": live_load.quality_hint()
+            }), 429
         app.rate_limit_store[client_ip] = requests_history + [current_time]
     else:
         app.rate_limit_store[client_ip] = [current_time]
@@ -383,7 +524,16 @@ def process_live_tryon():
         timestamp = int(time.time() * 1000)  # Milliseconds for better uniqueness
         temp_frame_filename = f"temp_frame_{timestamp}_{os.urandom(4).hex()}.jpg"
         temp_frame_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_frame_filename)
-        frame_file.save(temp_frame_path)
+        with live_load.stage('upload'):
+            frame_file.save(temp_frame_path)
+
+        if live_recorder:
+            # Recording is a diagnostic; a failure there must never fail the user's frame
+            try:
+                with open(temp_frame_path, 'rb') as f:
+                    live_recorder.record(client_ip, clothing_item_id, f.read())
+            except Exception as record_err:
+                app.logger.warning(f"Failed to record live frame: {record_err}")
         
         app.logger.debug(f"Frame saved to {temp_frame_path}")
         
@@ -393,35 +543,24 @@ def process_live_tryon():
             os.remove(temp_frame_path)  # Clean up temp file
             return jsonify({"error": f"Clothing item with ID {clothing_item_id} not found or missing imageUrl"}), 404
         
-        # Initialize clothing image cache if it doesn't exist
-        if not hasattr(app, 'clothing_cache'):
-            app.clothing_cache = {}
-            
-        # Check if we've already processed this clothing image
-        cache_key = f"clothing_{clothing_item_id}"
-        if cache_key in app.clothing_cache:
-            clothing_img = app.clothing_cache[cache_key]
-            app.logger.debug(f"Using cached clothing image for item {clothing_item_id}")
-        else:
-            # Download and process clothing image
-            try:
-                response = requests.get(clothing_item.imageUrl, stream=True, timeout=10)
-                response.raise_for_status()
-                clothing_img = Image.open(io.BytesIO(response.content)).convert("RGBA")
-                
-                # Process and remove background
-                clothing_img = remove_background(clothing_img)
-                
-                # Cache the processed image for future frames
-                app.clothing_cache[cache_key] = clothing_img
-                app.logger.debug(f"Cached clothing image for item {clothing_item_id}")
-            except requests.exceptions.RequestException as req_err:
-                os.remove(temp_frame_path)  # Clean up temp file
-                app.logger.error(f"Failed to download clothing image: {req_err}")
-                return jsonify({"error": "Failed to download clothing image"}), 502
+        # Get the background-removed garment, downloading it only on a cache miss
+        try:
+            _, template = get_garment_template(clothing_item, timeout=10)
+        except requests.exceptions.RequestException as req_err:
+            os.remove(temp_frame_path)  # Clean up temp file
+            app.logger.error(f"Failed to download clothing image: {req_err}")
+            return jsonify({"error": "Failed to download clothing image"}), 502
+        except SingleFlightTimeout as wait_err:
+            os.remove(temp_frame_path)  # Clean up temp file
+            app.logger.warning(f"Gave up waiting for clothing image: {wait_err}")
+            return jsonify({
+                "error": "Clothing image is still being prepared, please retry",
+                "qualityHint": live_load.quality_hint()
+            }), 503
         
         # Process the webcam frame
         try:
+            decode_start = time.time()
             # Use OpenCV for faster image processing
             user_img_cv = cv2.imread(temp_frame_path)
             if user_img_cv is None:
@@ -432,85 +571,35 @@ def process_live_tryon():
             
             # For PIL operations later, also load with PIL
             user_img = Image.open(temp_frame_path).convert("RGBA")
+            live_load.record('decode', time.time() - decode_start)
             
             # Get image dimensions
             h, w = user_img_rgb.shape[:2]
             
             # Detect pose landmarks
-            mp_pose = mp.solutions.pose
-            # Use lower model complexity for speed in live mode
-            pose_config = {
-                'static_image_mode': False,  # Switch to video mode for better tracking
-                'model_complexity': 0,       # Use lightweight model (0, 1, or 2)
-                'smooth_landmarks': True,    # Temporal smoothing for better stability
-                'min_detection_confidence': 0.5,
-                'min_tracking_confidence': 0.5
-            }
-            
-            with mp_pose.Pose(**pose_config) as pose:
+            # Use lower model complexity for speed in live mode (see pose_pool.POSE_CONFIGS)
+            with pose_pool.get_pool('live').acquire() as pose:
                 # Process frame
                 start_pose_detection = time.time()
                 results = pose.process(user_img_rgb)
                 pose_detection_time = time.time() - start_pose_detection
+                live_load.record('pose', pose_detection_time)
                 app.logger.debug(f"Pose detection completed in {pose_detection_time:.3f}s")
                 
                 if not results.pose_landmarks:
                     os.remove(temp_frame_path)  # Clean up temp file
                     return jsonify({"error": "Could not detect pose landmarks in frame"}), 422
                 
-                # Extract key landmarks for torso
-                lm = results.pose_landmarks.landmark
-                left_shoulder = lm[mp_pose.PoseLandmark.LEFT_SHOULDER]
-                right_shoulder = lm[mp_pose.PoseLandmark.RIGHT_SHOULDER]
-                left_hip = lm[mp_pose.PoseLandmark.LEFT_HIP]
-                right_hip = lm[mp_pose.PoseLandmark.RIGHT_HIP]
-                
-                # Calculate positioning
-                x1, y1 = int(left_shoulder.x * w), int(left_shoulder.y * h)
-                x2, y2 = int(right_shoulder.x * w), int(right_shoulder.y * h)
-                x3, y3 = int(left_hip.x * w), int(left_hip.y * h)
-                x4, y4 = int(right_hip.x * w), int(right_hip.y * h)
-                
-                # Compute bounding box for torso with padding
-                min_x = max(0, min(x1, x2) - int(w * 0.02))      # Add 2% width as padding
-                max_x = min(w, max(x1, x2, x3, x4) + int(w * 0.02))
-                min_y = max(0, min(y1, y2) - int(h * 0.02))      # Add 2% height as padding
-                max_y = min(h, max(y3, y4) + int(h * 0.02))
-                
-                box_width = max_x - min_x
-                box_height = max_y - min_y
-                
-                # If torso detection looks unreasonable, use fallback dimensions
-                if box_width < 20 or box_height < 50 or box_width / box_height > 2.5:
+                composite_start = time.time()
+                # Warp the garment so its shoulder/hip anchors follow the torso landmarks
+                points = torso_points(results.pose_landmarks.landmark, w, h)
+                matrix, used_fallback = live_transform(template, points, w, h)
+                if used_fallback:
                     app.logger.warning("Unusual torso dimensions detected, using fallback values")
-                    # Fallback to center with reasonable dimensions
-                    min_x = w // 4
-                    max_x = min_x + w // 2
-                    min_y = h // 4
-                    max_y = min_y + h // 2
-                    box_width = max_x - min_x
-                    box_height = max_y - min_y
-                
-                # Resize clothing image efficiently 
-                aspect = clothing_img.height / clothing_img.width
-                target_width = box_width
-                target_height = int(target_width * aspect)
-                
-                # Ensure clothing fits in the detection box
-                if target_height > box_height:
-                    target_height = box_height
-                    target_width = int(target_height / aspect)
-                
-                # Use BILINEAR for better performance (LANCZOS is higher quality but slower)
-                clothing_resized = clothing_img.resize((target_width, target_height), Image.BILINEAR)
                 
-                # Center clothing horizontally in box, align top with shoulders
-                paste_x = min_x + (box_width - target_width) // 2
-                paste_y = min_y
-                
-                # Composite images
-                result_img = user_img.copy()
-                result_img.paste(clothing_resized, (paste_x, paste_y), mask=clothing_resized)
+                # Composite images; only the garment's ROI of the frame is touched
+                result_img = Image.fromarray(warp_onto(np.array(user_img), template, matrix))
+                live_load.record('composite', time.time() - composite_start)
                 
                 # Track how many live results we've generated and manage them
                 if not hasattr(app, 'live_results_count'):
@@ -521,23 +610,14 @@ def process_live_tryon():
                 result_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
                 
                 # Save as JPEG for smaller file size (unless transparency needed)
-                result_img.save(result_path, format="PNG", optimize=True)
+                with live_load.stage('encode'):
+                    result_img.save(result_path, format="PNG", optimize=True)
                 
                 # Increment counter and clean old results if too many
                 app.live_results_count += 1
                 if app.live_results_count > 100:  # Keep only the latest 100 results
                     app.logger.info("Cleaning up old live try-on results")
-                    try:
-                        # Find and remove old live try-on files
-                        upload_dir = app.config['UPLOAD_FOLDER']
-                        live_tryon_files = sorted([f for f in os.listdir(upload_dir) 
-                                                  if f.startswith('live_tryon_')])
-                        # Delete oldest files except the most recent 50
-                        for old_file in live_tryon_files[:-50]:
-                            os.remove(os.path.join(upload_dir, old_file))
-                        app.live_results_count = 50  # Reset counter
-                    except Exception as cleanup_err:
-                        app.logger.error(f"Error cleaning up old files: {cleanup_err}")
+                    app.live_results_count = clean_old_results('live_tryon_', keep=50)
                 
                 # Clean up the temporary frame
                 try:
@@ -561,7 +641,8 @@ def process_live_tryon():
         return jsonify({
             "message": "Live try-on processed successfully",
             "resultImageUrl": result_url,
-            "processingTimeMs": int((time.time() - start_time) * 1000)
+            "processingTimeMs": int((time.time() - start_time) * 1000),
+            "qualityHint": live_load.quality_hint()
         }), 200
         
     except Exception as e:
@@ -588,17 +669,81 @@ def process_live_tryon():
             }), 500
 # -------------------------
 
+# --- NEW VIDEO TRY-ON ENDPOINT ---
+@app.route('/api/video-tryon', methods=['POST'])
+def process_video_tryon():
+    """
+    Produces a try-on video from an uploaded clip.
+    Expects 'video' (video file) and 'clothingItemId' in multipart/form-data.
+    Frames go through a decode -> pose tracking -> composite -> encode pipeline
+    in constant memory. Returns the result video URL and throughput stats.
+    """
+    if 'video' not in request.files:
+        return jsonify({"error": "No video part in the request"}), 400
+
+    video_file = request.files['video']
+    clothing_item_id = request.form.get('clothingItemId')
+
+    if not clothing_item_id:
+        return jsonify({"error": "Missing clothingItemId parameter"}), 400
+    if video_file.filename == '':
+        return jsonify({"error": "No video provided"}), 400
+    if not allowed_file(video_file.filename, ALLOWED_VIDEO_EXTENSIONS):
+        return jsonify({"error": "Video type not allowed"}), 400
+
+    clothing_item = ClothingItem.query.get(clothing_item_id)
+    if not clothing_item or not clothing_item.imageUrl:
+        return jsonify({"error": f"Clothing item with ID {clothing_item_id} not found or missing imageUrl"}), 404
+
+    extension = video_file.filename.rsplit('.', 1)[1].lower()
+    temp_video_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_video_{int(time.time() * 1000)}_{os.urandom(4).hex()}.{extension}")
+    result_filename = f"video_tryon_{int(time.time())}_{os.urandom(3).hex()}.mp4"
+    result_path = os.path.join(app.config['UPLOAD_FOLDER'], result_filename)
+
+    try:
+        video_file.save(temp_video_path)
+        _, template = get_garment_template(clothing_item)
+
+        stats = process_video(temp_video_path, result_path, template)
+        app.logger.info(f"Video try-on of {stats['frames']} frames completed at {stats['fps']} fps")
+
+        # Videos are large, so far fewer are kept than live frames
+        if not hasattr(app, 'video_results_count'):
+            app.video_results_count = 0
+        app.video_results_count += 1
+        if app.video_results_count > 20:  # Keep only the latest 20 results
+            app.logger.info("Cleaning up old video try-on results")
+            app.video_results_count = clean_old_results('video_tryon_', keep=10)
+        return jsonify({
+            "message": "Video try-on processed successfully",
+            "resultVideoUrl": f"/uploads/{result_filename}",
+            **stats
+        }), 200
+    except requests.exceptions.RequestException as req_err:
+        app.logger.error(f"Failed to download clothing image: {req_err}")
+        return jsonify({"error": "Failed to download clothing image"}), 502
+    except SingleFlightTimeout as e:
+        app.logger.warning(f"Gave up waiting for clothing image: {e}")
+        return jsonify({"error": "Clothing image is still being prepared, please retry"}), 503
+    except VideoTryOnError as e:
+        app.logger.warning(f"Video try-on failed: {e}")
+        if os.path.exists(result_path):
+            os.remove(result_path)
+        return jsonify({"error": "Could not read the uploaded video"}), 422
+    except Exception as e:
+        app.logger.exception(f"Error during video try-on processing: {e}")
+        if os.path.exists(result_path):
+            os.remove(result_path)
+        return jsonify({"error": "An internal error occurred during video try-on processing"}), 500
+    finally:
+        if os.path.exists(temp_video_path):
+            os.remove(temp_video_path)
+# -------------------------
+
 # Utility function to clear old cache entries
 def clear_old_cache(max_items=50):
     """Clear old entries from our in-memory caches to prevent memory bloat"""
-    if hasattr(app, 'clothing_cache') and len(app.clothing_cache) > max_items:
-        app.logger.info(f"Cleaning clothing cache ({len(app.clothing_cache)} items)")
-        # Convert to list to avoid mutation during iteration
-        items = list(app.clothing_cache.items())
-        # Remove oldest items, keeping the newest max_items
-        for key, _ in items[:-max_items]:
-            app.clothing_cache.pop(key, None)
-            
+    # Garments live in the shared asset store, which evicts on publish (ASSET_STORE_MAX_ITEMS)
     if hasattr(app, 'rate_limit_store'):
         # Clear old rate limit entries (older than 1 hour)
         current_time = time.time()
@@ -610,13 +755,49 @@ def clear_old_cache(max_items=50):
                 cleaned_store[ip] = recent_timestamps
         app.rate_limit_store = cleaned_store
 
+def preload_catalog_assets():
+    """
+    Publishes every catalog garment to the shared asset store, downloading and
+    background-removing only items that are missing or whose imageUrl changed.
+    Run in the serving parent before forking so workers start with every garment
+    mapped. Returns the number of items available.
+    """
+    loaded = 0
+    with app.app_context():
+        items = ClothingItem.query.filter(ClothingItem.imageUrl.isnot(None)).all()
+        for item in items:
+            try:
+                get_garment_template(item, timeout=15)
+            except Exception as e:
+                app.logger.warning(f"Skipping preload of item {item.id}: {e}")
+                continue
+            loaded += 1
+        # Connections must not be shared across a fork
+        db.engine.dispose()
+    app.logger.info(f"Preloaded {loaded} of {len(items)} catalog garments")
+    return loaded
+
 # Serve uploaded files
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     # Occasionally clean caches when serving files
     if random.random() < 0.05:  # 5% chance to run cleanup
         clear_old_cache()
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+
+    # Content-addressed files never change: let browsers and CDNs keep them forever,
+    # with the content hash as a strong ETag (conditional and range requests are
+    # handled by send_from_directory)
+    etag = result_cache.immutable_etag(filename)
+    if etag is None:
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    response = send_from_directory(
+        app.config['UPLOAD_FOLDER'], filename,
+        etag=etag, max_age=result_cache.IMMUTABLE_MAX_AGE, conditional=True
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.accept_ranges = "bytes"
+    return response
 
 # Cache management endpoint (admin only)
 @app.route('/api/admin/clear-cache', methods=['POST'])
@@ -627,25 +808,121 @@ def clear_cache():
         if request.remote_addr not in ('127.0.0.1', 'localhost'):
             return jsonify({"error": "Unauthorized access"}), 403
     
-    # Clear all caches
-    if hasattr(app, 'clothing_cache'):
-        cache_size = len(app.clothing_cache)
-        app.clothing_cache.clear()
-    else:
-        cache_size = 0
-        app.clothing_cache = {}
+    # Clear all caches; the asset store is shared, so this affects every worker
+    cache_size = asset_store.clear()
         
     if hasattr(app, 'rate_limit_store'):
         app.rate_limit_store.clear()
         
     if hasattr(app, 'live_results_count'):
         app.live_results_count = 0
+
+    if hasattr(app, 'video_results_count'):
+        app.video_results_count = 0
+
+    live_load.reset()
+    garment_templates.clear()
         
     return jsonify({
         "message": f"All caches cleared. Removed {cache_size} clothing cache items.",
         "success": True
     })
 
+# On-demand sampling profiler (admin only). Installs nothing until a profile is requested.
+route_profiler = RouteProfiler(app)
+PROFILE_MAX_SECONDS = 300
+# Profiles are saved here so whichever worker answers the follow-up request can return them
+PROFILE_DIR = os.path.join(log_dir, 'profiles')
+
+def _admin_profile_allowed():
+    # Stack traces expose internals, so this is localhost-only even in debug mode
+    return request.remote_addr in ('127.0.0.1', '::1', 'localhost')
+
+def _profile_coverage():
+    """How many worker processes serve traffic and how many of them a profile does not see."""
+    workers = app.config.get('SERVER_WORKERS', 1)
+    return {"workers": workers, "unsampledWorkers": workers - 1}
+
+@app.route('/api/admin/profile', methods=['POST'])
+def start_profile():
+    """
+    Starts sampling the stacks of requests to one route in this worker and returns
+    at once with a profile id; fetch the result from /api/admin/profile/<id>.
+    Expects JSON body with 'route' and optionally 'requests', 'seconds', 'intervalMs'.
+    The profile ends after the next 'requests' requests have finished or 'seconds' have passed.
+    """
+    if not _admin_profile_allowed():
+        return jsonify({"error": "Unauthorized access"}), 403
+
+    data = request.get_json(silent=True) or {}
+    route = data.get('route')
+    endpoint = next((rule.endpoint for rule in app.url_map.iter_rules() if rule.rule == route), None)
+    if endpoint is None or endpoint in ('start_profile', 'get_profile', 'static'):
+        return jsonify({"error": f"Unknown or unsupported route '{route}'"}), 400
+
+    try:
+        max_requests = int(data['requests']) if data.get('requests') else None
+        max_seconds = min(float(data.get('seconds', 30)), PROFILE_MAX_SECONDS)
+        interval = max(float(data.get('intervalMs', 5)), 1) / 1000
+    except (TypeError, ValueError):
+        return jsonify({"error": "'requests', 'seconds' and 'intervalMs' must be numbers"}), 400
+
+    profile_id = os.urandom(8).hex()
+    record = {"profileId": profile_id, "route": route, "pid": os.getpid(), "started": time.time(), **_profile_coverage()}
+
+    def on_done(stacks, stats):
+        if stacks is None:
+            app.logger.error(f"Profile {profile_id} of {route} failed: {stats['error']}")
+            save_profile(PROFILE_DIR, profile_id, {**record, "status": "failed", **stats})
+            return
+        app.logger.info(f"Profile {profile_id} of {route} finished: {stats}")
+        save_profile(PROFILE_DIR, profile_id, {
+            **record, "status": "done", **stats, "stacks": stacks.most_common()
+        })
+
+    app.logger.info(f"Profiling {route} for up to {max_requests or 'unlimited'} requests / {max_seconds}s as {profile_id}")
+    try:
+        # Saved before sampling starts, so the result URL never 404s while it runs
+        prune_profiles(PROFILE_DIR)
+        save_profile(PROFILE_DIR, profile_id, {**record, "status": "running"})
+        route_profiler.start(endpoint, on_done, max_requests, max_seconds, interval)
+    except ProfilerBusy as e:
+        os.remove(os.path.join(PROFILE_DIR, f"{profile_id}.json"))
+        return jsonify({"error": str(e)}), 409
+
+    return jsonify({
+        **record,
+        "status": "running",
+        "resultUrl": f"/api/admin/profile/{profile_id}"
+    }), 202
+
+@app.route('/api/admin/profile/<profile_id>')
+def get_profile(profile_id):
+    """
+    Returns a finished profile as collapsed stacks (flamegraph.pl / speedscope input),
+    or as JSON with ?format=json. Answers 202 while the profile is still running.
+    """
+    if not _admin_profile_allowed():
+        return jsonify({"error": "Unauthorized access"}), 403
+
+    record = load_profile(PROFILE_DIR, profile_id) if is_profile_id(profile_id) else None
+    if record is None:
+        return jsonify({"error": f"Unknown profile '{profile_id}'"}), 404
+    if record["status"] != "done":
+        return jsonify(record), 202 if record["status"] == "running" else 500
+
+    if request.args.get('format') == 'json':
+        record["stacks"] = [{"stack": stack, "count": count} for stack, count in record["stacks"]]
+        return jsonify(record)
+    headers = {
+        "X-Profile-Requests": str(record["requests"]),
+        "X-Profile-Samples": str(record["samples"]),
+        "X-Profile-Seconds": str(record["seconds"]),
+        "X-Profile-Workers": str(record["workers"]),
+        "X-Profile-Unsampled-Workers": str(record["unsampledWorkers"])
+    }
+    return to_collapsed(Counter(dict(record["stacks"]))), 200, {"Content-Type": "text/plain; charset=utf-8", **headers}
+
 # Add other routes later...
 
 if __name__ == '__main__':
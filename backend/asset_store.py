@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from garment_warp import GarmentTemplate
+
+try:
+    import fcntl  # Cross-process locking; not available on Windows
+except ImportError:
+    fcntl = None
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+
+def default_store_dir(namespace):
+    """
+    RAM-backed /dev/shm where available, otherwise a directory next to the app.
+    Args:
+        namespace: Identifies the catalog the store belongs to (e.g. the database
+            path), so several checkouts on one machine never share garment keys
+    """
+    suffix = hashlib.sha256(namespace.encode()).hexdigest()[:12]
+    if os.path.isdir("/dev/shm"):
+        return f"/dev/shm/virtual-tryon-assets-{suffix}"
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "asset_store", suffix)
+
+
+class AssetStore:
+    """
+    Warp-ready garment templates shared by every process on the box. Each template's
+    pyramid levels are published once as .npy files and memory-mapped read-only by
+    readers, so all workers use the same physical pages (zero-copy NumPy views).
+    A small JSON index records, per garment key, the current version (a token never
+    reused, even after eviction or clear), the source
+    it was built from, the level shapes, the anchor points and a content digest.
+    Publishing writes new files first and then swaps the index with an atomic rename,
+    so readers see either the old version or the new one, never a partial item.
+    Args:
+        directory: Where the index and pixel files live
+        max_items: Oldest-published items beyond this count are evicted on publish
+    """
+
+    def __init__(self, directory, max_items=500):
+        self.directory = directory
+        self.max_items = max_items
+        os.makedirs(directory, exist_ok=True)
+        self._index = {}
+        self._index_signature = None
+        self._mapped = {}  # key -> (version, GarmentTemplate) mapped by this process
+        self._lock = threading.Lock()
+
+    # --- Index handling ---
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _index_lock(self):
+        # Serialises read-modify-write of the index between processes (and threads)
+        with self._lock, open(self._path(LOCK_FILE), "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def key_lock(self, key, timeout=None):
+        """
+        Holds an exclusive per-key lock shared by every process using the store, so
+        only one of them builds a missing item while the others wait and then map it.
+        Pair with an in-process single flight; threads of one process don't queue here.
+        Raises:
+            TimeoutError: If the lock isn't acquired within timeout seconds
+        """
+        with open(self._path(f"{key}.lock"), "a") as lock_file:
+            if fcntl:
+                deadline = None if timeout is None else time.time() + timeout
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if deadline is not None and time.time() >= deadline:
+                            raise TimeoutError(f"Timed out after {timeout}s waiting to build '{key}'")
+                        time.sleep(0.05)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        """Returns the current index, re-reading the file only when it has changed."""
+        try:
+            stat = os.stat(self._path(INDEX_FILE))
+        except FileNotFoundError:
+            return {}
+        # Every publish renames a new file into place, so the inode changes too
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if signature != self._index_signature:
+            with open(self._path(INDEX_FILE)) as f:
+                self._index = json.load(f)
+            self._index_signature = signature
+            # Unmap items that were replaced, evicted or cleared (possibly by another
+            # process), so their deleted files don't stay pinned in memory
+            self._mapped = {
+                key: mapped for key, mapped in self._mapped.items()
+                if key in self._index and self._index[key]["version"] == mapped[0]
+            }
+        return self._index
+
+    def _write_index(self, index):
+        temp_path = self._path(f".{INDEX_FILE}.{os.getpid()}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(temp_path, self._path(INDEX_FILE))
+
+    def _level_file(self, key, version, level):
+        return f"{key}.v{version}.{level}.npy"
+
+    def _remove_files(self, entry_key, entry):
+        # Processes that already mapped these keep their pages until they unmap (POSIX)
+        for level in range(len(entry["shapes"])):
+            try:
+                os.remove(self._path(self._level_file(entry_key, entry["version"], level)))
+            except OSError:
+                pass
+
+    # --- Public API ---
+
+    def get(self, key, source=None):
+        """
+        Maps the current version of a garment.
+        Args:
+            key: Garment key (e.g. "clothing_<id>")
+            source: If given, only return the item if it was built from this source
+                (e.g. the item's imageUrl), so a changed image triggers a rebuild
+        Returns:
+            GarmentTemplate backed by read-only memory maps, or None if not published
+        """
+        with self._lock:
+            entry = self._read_index().get(key)
+            if entry is None or (source is not None and entry["source"] != source):
+                return None
+            mapped = self._mapped.get(key)
+            if mapped and mapped[0] == entry["version"]:
+                return mapped[1]
+            try:
+                levels = [
+                    np.load(self._path(self._level_file(key, entry["version"], level)), mmap_mode="r")
+                    for level in range(len(entry["shapes"]))
+                ]
+            except FileNotFoundError:
+                # Evicted or rebuilt between reading the index and opening the files
+                return None
+            template = GarmentTemplate.from_levels(
+                levels, np.array(entry["anchors"], dtype=np.float32), digest=entry.get("digest")
+            )
+            self._mapped[key] = (entry["version"], template)
+            return template
+
+    def publish(self, key, template, source=None):
+        """
+        Stores a template as the new version of key and returns a mapped view of it.
+        """
+        with self._index_lock():
+            index = dict(self._read_index())
+            previous = index.get(key)
+            # Unique for good: a reused number would let a process that still has the
+            # old item mapped under that version keep serving it
+            version = f"{int(time.time() * 1000):x}-{os.urandom(4).hex()}"
+
+            for level, pixels in enumerate(template.levels):
+                final_path = self._path(self._level_file(key, version, level))
+                temp_path = f"{final_path}.{os.getpid()}.tmp"
+                with open(temp_path, "wb") as f:
+                    np.save(f, np.ascontiguousarray(pixels))
+                os.replace(temp_path, final_path)
+
+            index[key] = {
+                "version": version,
+                "source": source,
+                "shapes": [list(pixels.shape) for pixels in template.levels],
+                "anchors": template.anchors.tolist(),
+                "digest": template.digest,
+                "published": time.time()
+            }
+            evicted = sorted(
+                (k for k in index if k != key), key=lambda k: index[k]["published"]
+            )[:max(0, len(index) - self.max_items)]
+            removed = {k: index.pop(k) for k in evicted}
+            self._write_index(index)
+            for old_key in removed:
+                self._mapped.pop(old_key, None)
+
+            if previous:
+                self._remove_files(key, previous)
+            for old_key, entry in removed.items():
+                self._remove_files(old_key, entry)
+        return self.get(key)
+
+    def clear(self):
+        """Unpublishes every item. Returns how many were removed."""
+        with self._index_lock():
+            index = self._read_index()
+            for key, entry in index.items():
+                self._remove_files(key, entry)
+            self._write_index({})
+            self._mapped.clear()
+            return len(index)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._read_index())
@@ -0,0 +1,267 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Where the anchor rows sit inside the garment's opaque bounding box, as a
+# fraction of its height, and how far to pull each anchor in from the row's
+# outer edge (sleeves and hems stick out past the shoulder and hip joints)
+SHOULDER_ROW = 0.12
+SHOULDER_INSET = 0.18
+HIP_ROW = 0.92
+HIP_INSET = 0.06
+
+# Pixels with less alpha than this are treated as background when locating anchors
+ALPHA_THRESHOLD = 16
+
+# Smallest side a pyramid level is allowed to have
+MIN_LEVEL_SIZE = 32
+
+
+class GarmentTemplate:
+    """
+    Precomputed, warp-ready data for one garment image.
+    Attributes:
+        anchors: float32 array (4, 2) of garment-image points in the order
+            image-left shoulder, image-right shoulder, image-left hip, image-right hip
+        levels: list of premultiplied RGBA uint8 arrays, each half the size of
+            the previous, so large downscales never sample the full-size image
+        size: (width, height) of level 0
+        digest: SHA-256 hex of the garment's pixels and anchors
+    """
+
+    def __init__(self, rgba):
+        self._digest = None
+        rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+        self.size = (rgba.shape[1], rgba.shape[0])
+        self.anchors = find_anchor_points(rgba[..., 3])
+
+        # Premultiply once so bilinear sampling doesn't bleed background colour into edges
+        premultiplied = rgba.copy()
+        alpha = rgba[..., 3:4].astype(np.uint16)
+        premultiplied[..., :3] = (rgba[..., :3].astype(np.uint16) * alpha // 255).astype(np.uint8)
+
+        self.levels = [premultiplied]
+        while min(self.levels[-1].shape[:2]) // 2 >= MIN_LEVEL_SIZE:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+
+    @classmethod
+    def from_levels(cls, levels, anchors, digest=None):
+        """
+        Rebuilds a template from already prepared levels and anchors, e.g. read-only
+        memory maps from the asset store. Nothing is copied.
+        """
+        template = cls.__new__(cls)
+        template.levels = list(levels)
+        template.size = (levels[0].shape[1], levels[0].shape[0])
+        template.anchors = anchors
+        template._digest = digest
+        return template
+
+    @property
+    def digest(self):
+        # Computed on first use; level 0 and the anchors determine everything else
+        if self._digest is None:
+            hasher = hashlib.sha256()
+            hasher.update(str(self.levels[0].shape).encode())
+            hasher.update(np.ascontiguousarray(self.levels[0]))
+            hasher.update(np.ascontiguousarray(self.anchors, dtype=np.float32))
+            self._digest = hasher.hexdigest()
+        return self._digest
+
+
+def find_anchor_points(alpha):
+    """
+    Locates shoulder and hip anchor points on a garment from its alpha mask.
+    Args:
+        alpha: uint8 array (H, W) alpha channel of the garment
+    Returns:
+        float32 array (4, 2), see GarmentTemplate.anchors
+    """
+    h, w = alpha.shape
+    mask = alpha >= ALPHA_THRESHOLD
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0:
+        # Fully transparent garment; anchor on the image frame instead
+        y0, y1, x0, x1 = 0, h - 1, 0, w - 1
+    else:
+        y0, y1, x0, x1 = rows[0], rows[-1], cols[0], cols[-1]
+    box_h = y1 - y0
+
+    def row_extent(fraction, inset):
+        y = int(y0 + fraction * box_h)
+        xs = np.flatnonzero(mask[y])
+        left, right = (xs[0], xs[-1]) if xs.size else (x0, x1)
+        pad = (right - left) * inset
+        return [left + pad, y], [right - pad, y]
+
+    left_shoulder, right_shoulder = row_extent(SHOULDER_ROW, SHOULDER_INSET)
+    left_hip, right_hip = row_extent(HIP_ROW, HIP_INSET)
+    return np.array([left_shoulder, right_shoulder, left_hip, right_hip], dtype=np.float32)
+
+
+def landmark_transform(template, dst_points):
+    """
+    Least-squares affine transform taking the garment anchors onto the body.
+    Args:
+        template: GarmentTemplate
+        dst_points: array-like (4, 2) of frame pixel coordinates in the same
+            order as the template anchors
+    Returns:
+        float32 2x3 affine matrix in garment level-0 coordinates, or None if
+        the points are degenerate (e.g. the person is side-on)
+    """
+    dst = np.asarray(dst_points, dtype=np.float32)
+    src = np.hstack([template.anchors, np.ones((4, 1), dtype=np.float32)])
+    solution, _, rank, _ = np.linalg.lstsq(src, dst, rcond=None)
+    if rank < 3:
+        return None
+    matrix = solution.T.astype(np.float32)
+    if abs(np.linalg.det(matrix[:, :2])) < 1e-3:
+        return None
+    return matrix
+
+
+def fit_box_transform(template, box):
+    """
+    Scale-and-translate transform fitting the garment into a box, keeping its
+    aspect ratio, centred horizontally and top-aligned (the pre-warp behaviour).
+    Args:
+        template: GarmentTemplate
+        box: (min_x, min_y, max_x, max_y) in frame pixels
+    Returns:
+        float32 2x3 affine matrix
+    """
+    min_x, min_y, max_x, max_y = box
+    w, h = template.size
+    scale = min((max_x - min_x) / w, (max_y - min_y) / h)
+    offset_x = min_x + ((max_x - min_x) - w * scale) / 2
+    return np.array([[scale, 0, offset_x], [0, scale, min_y]], dtype=np.float32)
+
+
+def live_transform(template, points, w, h):
+    """
+    Transform used by live and video try-on: follows the landmarks when the
+    padded torso box looks plausible, otherwise fits the garment into the
+    centre of the frame.
+    Args:
+        template: GarmentTemplate
+        points: Torso points in anchor order (see pose_pool.torso_points)
+        w, h: Frame size in pixels
+    Returns:
+        (matrix, used_fallback) tuple
+    """
+    xs = [int(p[0]) for p in points]
+    ys = [int(p[1]) for p in points]
+
+    # Compute bounding box for torso with 2% padding
+    min_x = max(0, min(xs[:2]) - int(w * 0.02))
+    max_x = min(w, max(xs) + int(w * 0.02))
+    min_y = max(0, min(ys[:2]) - int(h * 0.02))
+    max_y = min(h, max(ys[2:]) + int(h * 0.02))
+    box_width = max_x - min_x
+    box_height = max_y - min_y
+
+    # If torso detection looks unreasonable, fall back to the centre of the frame
+    if box_width < 20 or box_height < 50 or box_width / box_height > 2.5:
+        min_x, min_y = w // 4, h // 4
+        return fit_box_transform(template, (min_x, min_y, min_x + w // 2, min_y + h // 2)), True
+
+    matrix = landmark_transform(template, points)
+    if matrix is None:
+        matrix = fit_box_transform(template, (min_x, min_y, max_x, max_y))
+    return matrix, False
+
+
+def warp_onto(frame, template, matrix):
+    """
+    Warps the garment with the given transform and alpha-blends it onto the
+    frame in place. Only the region the garment lands on is touched.
+    Args:
+        frame: uint8 array (H, W, 3) or (H, W, 4); colour order must match the garment
+        template: GarmentTemplate
+        matrix: 2x3 affine matrix from landmark_transform or fit_box_transform
+    Returns:
+        The frame, for convenience
+    """
+    fh, fw = frame.shape[:2]
+    gw, gh = template.size
+
+    # Destination ROI is the bounding box of the warped garment corners
+    corners = np.array([[0, 0, 1], [gw, 0, 1], [0, gh, 1], [gw, gh, 1]], dtype=np.float32)
+    warped_corners = corners @ matrix.T
+    x0 = max(0, int(np.floor(warped_corners[:, 0].min())))
+    y0 = max(0, int(np.floor(warped_corners[:, 1].min())))
+    x1 = min(fw, int(np.ceil(warped_corners[:, 0].max())))
+    y1 = min(fh, int(np.ceil(warped_corners[:, 1].max())))
+    if x1 <= x0 or y1 <= y0:
+        return frame
+
+    # Sample from the pyramid level closest to (but not smaller than) the target scale
+    scale = np.sqrt(abs(np.linalg.det(matrix[:, :2])))
+    level = 0
+    while level + 1 < len(template.levels) and scale * (2 ** (level + 1)) <= 1:
+        level += 1
+    source = template.levels[level]
+
+    # Re-express the transform in level coordinates and shift it into the ROI
+    level_matrix = matrix.copy()
+    level_matrix[:, :2] *= 2 ** level
+    level_matrix[:, 2] -= (x0, y0)
+
+    warped = cv2.warpAffine(
+        source, level_matrix, (x1 - x0, y1 - y0),
+        flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0
+    )
+
+    roi = frame[y0:y1, x0:x1]
+    alpha = warped[..., 3:4].astype(np.float32) * (1 / 255)
+    roi[..., :3] = (roi[..., :3] * (1 - alpha) + warped[..., :3]).astype(np.uint8)
+    if frame.shape[2] == 4:
+        roi[..., 3] = np.maximum(roi[..., 3], warped[..., 3])
+    return frame
+
+
+class TemplateCache:
+    """
+    Small thread-safe LRU cache of GarmentTemplates keyed by garment cache key.
+    Args:
+        max_items: How many templates to keep
+    """
+
+    def __init__(self, max_items=50):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load_image):
+        """
+        Returns the template for key, building it on a miss.
+        Args:
+            key: Garment cache key (e.g. "clothing_<id>")
+            load_image: Zero-argument callable returning the garment as a Pillow
+                image; only called on a miss, so hits never decode anything
+        Returns:
+            GarmentTemplate
+        """
+        with self._lock:
+            template = self._items.get(key)
+            if template is not None:
+                self._items.move_to_end(key)
+                return template
+
+        template = GarmentTemplate(np.array(load_image().convert("RGBA")))
+        with self._lock:
+            self._items[key] = template
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return template
+
+    def clear(self):
+        with self._lock:
+            size = len(self._items)
+            self._items.clear()
+        return size
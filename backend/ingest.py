@@ -0,0 +1,80 @@
+import hashlib
+import os
+
+from PIL import Image, ImageOps
+
+# Size of each chunk read from the upload stream while hashing
+CHUNK_SIZE = 64 * 1024
+
+# Normalized user images are stored under this prefix plus their content id
+USER_IMAGE_PREFIX = "user_"
+USER_IMAGE_EXTENSION = ".jpg"
+
+
+def normalized_filename(content_id):
+    """Name of the normalized image stored for a content id."""
+    return f"{USER_IMAGE_PREFIX}{content_id}{USER_IMAGE_EXTENSION}"
+
+
+def is_content_id(value):
+    """True if value looks like a content id returned by ingest_upload."""
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def ingest_upload(file_storage, upload_dir, max_dimension=1280, jpeg_quality=90):
+    """
+    Streams an uploaded image to disk while hashing it, and stores a normalized
+    copy keyed by the hash. Re-uploading identical bytes reuses the stored copy.
+    Normalization applies the EXIF orientation, downscales so neither side exceeds
+    max_dimension, drops all metadata and re-encodes as baseline JPEG, which is
+    the cheapest format for the try-on pipeline to decode.
+    Args:
+        file_storage: werkzeug FileStorage from request.files
+        upload_dir: Directory normalized images are stored in
+        max_dimension: Longest allowed side of the stored image, in pixels
+        jpeg_quality: JPEG quality of the stored image
+    Returns:
+        (content_id, filename, deduplicated) tuple
+    Raises:
+        ValueError: If the upload can't be decoded as an image
+    """
+    hasher = hashlib.sha256()
+    temp_path = os.path.join(upload_dir, f".ingest_{os.urandom(8).hex()}")
+    try:
+        # Stream to disk in chunks so large uploads never sit in memory twice
+        with open(temp_path, "wb") as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+
+        content_id = hasher.hexdigest()
+        filename = normalized_filename(content_id)
+        final_path = os.path.join(upload_dir, filename)
+        if os.path.exists(final_path):
+            return content_id, filename, True
+
+        try:
+            with Image.open(temp_path) as img:
+                img = ImageOps.exif_transpose(img)
+                if img.mode != "RGB":
+                    # Flatten transparency onto white; uploads are photos of people
+                    rgba = img.convert("RGBA")
+                    img = Image.new("RGB", rgba.size, (255, 255, 255))
+                    img.paste(rgba, mask=rgba.getchannel("A"))
+                img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+                # Write next to the final name and rename so readers never see a partial file
+                normalized_temp = f"{temp_path}.jpg"
+                img.save(normalized_temp, format="JPEG", quality=jpeg_quality, optimize=True)
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ValueError(f"Uploaded file is not a readable image: {e}") from e
+
+        os.replace(normalized_temp, final_path)
+        return content_id, filename, False
+    finally:
+        for path in (temp_path, f"{temp_path}.jpg"):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,104 @@
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Stages of the live try-on pipeline that are timed per request. Fetching the garment
+# is left out: a cache miss (download + background removal) is a one-off cost of
+# that item, not a sign of load, and must not throttle every session on the worker.
+LIVE_STAGES = ('upload', 'decode', 'pose', 'composite', 'encode')
+
+# Suggested intervals stay this much above the rate-limit spacing, so upload jitter
+# that bunches a client's frames together doesn't push it over the limit
+INTERVAL_MARGIN = 1.1
+
+# Quality tiers handed to clients, from best (idle server) to cheapest (overloaded)
+QUALITY_TIERS = [
+    {"captureWidth": 640, "captureHeight": 480, "jpegQuality": 0.85},
+    {"captureWidth": 640, "captureHeight": 480, "jpegQuality": 0.75},
+    {"captureWidth": 480, "captureHeight": 360, "jpegQuality": 0.7},
+    {"captureWidth": 320, "captureHeight": 240, "jpegQuality": 0.6},
+]
+
+# Upper bounds on "pressure" for each tier above; anything beyond the last one
+# falls into the cheapest tier
+TIER_PRESSURE_LIMITS = (0.5, 1.0, 2.0)
+
+
+class LoadMonitor:
+    """
+    Tracks recent per-stage latencies and the number of in-flight live try-on
+    requests, and turns them into a quality hint for clients.
+    Args:
+        min_interval_ms: Rate-limit spacing; suggested intervals stay INTERVAL_MARGIN
+            above it so well-behaved clients don't get a 429
+        target_latency_ms: Per-frame latency the server is comfortable with
+        window: How many recent samples to keep per stage
+    """
+
+    def __init__(self, min_interval_ms, target_latency_ms=250, window=50):
+        self.min_interval_ms = min_interval_ms
+        self.target_latency_ms = target_latency_ms
+        self._samples = {stage: deque(maxlen=window) for stage in LIVE_STAGES}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self):
+        """Counts the enclosed block as one in-flight request."""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block and records it under the given stage."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples[name].append(seconds * 1000)
+
+    def service_time_ms(self):
+        """Sum of the recent median latency of every stage (a single slow frame doesn't move it)."""
+        with self._lock:
+            return sum(statistics.median(s) for s in self._samples.values() if s)
+
+    def quality_hint(self):
+        """
+        Computes the capture settings clients should use for their next frames.
+        Returns:
+            dict with captureWidth, captureHeight, jpegQuality and frameIntervalMs
+        """
+        service_ms = self.service_time_ms()
+        with self._lock:
+            queue_depth = self._in_flight
+
+        # Time a new frame would spend waiting behind the current queue plus its own work
+        expected_ms = service_ms * max(1, queue_depth)
+        pressure = expected_ms / self.target_latency_ms if self.target_latency_ms else 0
+
+        tier = len(TIER_PRESSURE_LIMITS)
+        for i, limit in enumerate(TIER_PRESSURE_LIMITS):
+            if pressure < limit:
+                tier = i
+                break
+
+        hint = dict(QUALITY_TIERS[tier])
+        hint["frameIntervalMs"] = int(max(self.min_interval_ms * INTERVAL_MARGIN, expected_ms))
+        hint["queueDepth"] = queue_depth
+        return hint
+
+    def reset(self):
+        with self._lock:
+            for samples in self._samples.values():
+                samples.clear()
@@ -0,0 +1,283 @@
+import ipaddress
+import math
+import os
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Session file format ---
+# A session file is MAGIC followed by one record per frame:
+#   RECORD header (ms since session start, clothing item id or -1, JPEG length) + JPEG bytes
+MAGIC = b"VTRS\x01"
+RECORD = struct.Struct("<IiI")
+SESSION_EXTENSION = ".vtrs"
+
+
+class SessionRecorder:
+    """
+    Appends live try-on frames to per-client session files. A client that sends
+    nothing for idle_seconds has its file closed and starts a new session file on
+    its next frame. Each worker process writes its own files (the pid is part of the
+    name); load_recordings merges one client's fragments back into a single session.
+    Args:
+        directory: Where session files are written
+        idle_seconds: Gap after which a client's session is closed
+    """
+
+    def __init__(self, directory, idle_seconds=30):
+        self.directory = directory
+        self.idle_seconds = idle_seconds
+        os.makedirs(directory, exist_ok=True)
+        self._sessions = {}  # client -> [file, start_time, last_time]
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, client, clothing_item_id, frame_bytes):
+        now = time.time()
+        try:
+            item_id = int(clothing_item_id)
+        except (TypeError, ValueError):
+            item_id = -1
+
+        with self._lock:
+            # Close sessions of clients that went quiet, including ones that never come back
+            if now - self._last_sweep >= 1:
+                self._close_idle(now)
+            session = self._sessions.get(client)
+            if session is None:
+                safe_client = "".join(c if c.isalnum() else "-" for c in client)
+                name = f"{safe_client}_{int(now * 1000)}_{os.getpid()}{SESSION_EXTENSION}"
+                f = open(os.path.join(self.directory, name), "wb")
+                f.write(MAGIC)
+                session = self._sessions[client] = [f, now, now]
+            f = session[0]
+            session[2] = now
+            f.write(RECORD.pack(int((now - session[1]) * 1000), item_id, len(frame_bytes)))
+            f.write(frame_bytes)
+            f.flush()
+
+    def _close_idle(self, now):
+        for client in [c for c, session in self._sessions.items() if now - session[2] > self.idle_seconds]:
+            self._sessions.pop(client)[0].close()
+        self._last_sweep = now
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session[0].close()
+            self._sessions.clear()
+
+
+def read_session(path):
+    """
+    Loads a recorded session.
+    Returns:
+        List of (offset_seconds, clothing_item_id, jpeg_bytes) tuples
+    Raises:
+        ValueError: If the file is not a session recording
+    """
+    frames = []
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not a recorded live session")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                # A truncated final record means the recording was cut off mid-frame
+                break
+            offset_ms, item_id, length = RECORD.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                break
+            frames.append((offset_ms / 1000, item_id, data))
+    return frames
+
+
+def load_recordings(paths, idle_seconds=30):
+    """
+    Loads session files and merges the fragments of one client's session that
+    different worker processes recorded. Fragments of the same client are joined
+    when they are less than idle_seconds apart.
+    Args:
+        paths: Session files written by SessionRecorder
+        idle_seconds: The recorder's idle gap
+    Returns:
+        List of (name, frames) with frames as returned by read_session
+    Raises:
+        ValueError: If a file is not a session recording
+    """
+    fragments = {}  # client -> [(start_seconds, name, frames)]
+    standalone = []
+    for path in paths:
+        name = os.path.basename(path)
+        frames = read_session(path)
+        if not frames:
+            continue
+        # <client>_<start ms>_<pid>.vtrs; files named otherwise are replayed as they are
+        parts = name[:-len(SESSION_EXTENSION)].split("_") if name.endswith(SESSION_EXTENSION) else []
+        if len(parts) == 3 and parts[1].isdigit():
+            fragments.setdefault(parts[0], []).append((int(parts[1]) / 1000, name, frames))
+        else:
+            standalone.append((name, frames))
+
+    merged = []
+    for client, client_fragments in sorted(fragments.items()):
+        sessions = []  # [last_frame_time, names, [(absolute_time, item_id, data)]]
+        for start, name, frames in sorted(client_fragments, key=lambda fragment: fragment[0]):
+            absolute = [(start + offset, item_id, data) for offset, item_id, data in frames]
+            if sessions and start - sessions[-1][0] <= idle_seconds:
+                session = sessions[-1]
+                session[1].append(name)
+                session[2].extend(absolute)
+                session[0] = max(session[0], absolute[-1][0])
+            else:
+                sessions.append([absolute[-1][0], [name], absolute])
+        for _, names, frames in sessions:
+            frames.sort(key=lambda frame: frame[0])
+            first = frames[0][0]
+            label = names[0] if len(names) == 1 else f"{names[0]} (+{len(names) - 1} fragments)"
+            merged.append((label, [(t - first, item_id, data) for t, item_id, data in frames]))
+    return merged + standalone
+
+
+# --- Replay ---
+
+class _SourceAddressAdapter(HTTPAdapter):
+    """Sends requests from a fixed local address, so each replayed session looks like its own client."""
+
+    def __init__(self, source_ip, **kwargs):
+        self.source_ip = source_ip
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["source_address"] = (self.source_ip, 0)
+        super().init_poolmanager(*args, **kwargs)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _replay_one(base_url, frames, speed, default_item_id, source_ip, stats):
+    session = requests.Session()
+    if source_ip:
+        adapter = _SourceAddressAdapter(source_ip)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    url = f"{base_url.rstrip('/')}/api/live-tryon"
+    start = time.time()
+    for i, (offset, item_id, data) in enumerate(frames):
+        due = start + offset / speed
+        wait = due - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        # Like the browser, a session has one frame in flight; frames whose successor
+        # is already due while we were busy are skipped
+        if i + 1 < len(frames) and time.time() > start + frames[i + 1][0] / speed:
+            stats["dropped"] += 1
+            continue
+
+        if item_id < 0:
+            item_id = default_item_id
+        sent = time.time()
+        try:
+            response = session.post(
+                url,
+                files={"frame": ("frame.jpg", data, "image/jpeg")},
+                data={"clothingItemId": str(item_id)},
+                timeout=30
+            )
+            status = response.status_code
+        except requests.exceptions.RequestException:
+            status = None
+        latency = time.time() - sent
+
+        stats["sent"] += 1
+        if status == 200:
+            stats["ok"] += 1
+            stats["latencies"].append(latency)
+        elif status == 429:
+            stats["throttled"] += 1
+        else:
+            stats["errors"] += 1
+    stats["seconds"] = time.time() - start
+
+
+def replay_sessions(base_url, recordings, concurrency, speed=1.0, default_item_id=1, distinct_sources=True):
+    """
+    Replays recorded sessions concurrently against a backend.
+    Args:
+        base_url: Backend root, e.g. http://127.0.0.1:5000
+        recordings: List of (name, frames) from read_session; sessions cycle through them
+        concurrency: Number of sessions to run at once (K)
+        speed: Frame-rate multiplier; 2.0 replays at twice the recorded rate
+        default_item_id: clothingItemId for frames recorded without one
+        distinct_sources: Against a loopback URL, send each session from its own
+            127.0.0.x address so per-IP rate limiting applies per session as in production
+    Returns:
+        (per_session_stats, summary) tuple of dicts
+    """
+    # Only an IPv4 loopback target can be reached from arbitrary 127.0.0.0/8 source addresses
+    host = urlparse(base_url).hostname or ""
+    try:
+        address = ipaddress.ip_address(host)
+        loopback = address.version == 4 and address.is_loopback
+    except ValueError:
+        loopback = False
+
+    results = []
+    threads = []
+    for i in range(concurrency):
+        name, frames = recordings[i % len(recordings)]
+        stats = {"session": i, "recording": name, "frames": len(frames), "sent": 0, "ok": 0,
+                 "throttled": 0, "errors": 0, "dropped": 0, "latencies": [], "seconds": 0.0}
+        source_ip = f"127.0.{(i + 2) // 254}.{(i + 2) % 254 + 1}" if distinct_sources and loopback else None
+        thread = threading.Thread(
+            target=_replay_one, args=(base_url, frames, speed, default_item_id, source_ip, stats), daemon=True
+        )
+        results.append(stats)
+        threads.append(thread)
+
+    wall_start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.time() - wall_start
+
+    all_latencies = []
+    for stats in results:
+        stats["fps"] = stats["ok"] / stats["seconds"] if stats["seconds"] else 0.0
+        stats["p50Ms"] = _ms(percentile(stats["latencies"], 0.50))
+        stats["p95Ms"] = _ms(percentile(stats["latencies"], 0.95))
+        stats["p99Ms"] = _ms(percentile(stats["latencies"], 0.99))
+        all_latencies.extend(stats.pop("latencies"))
+
+    summary = {
+        "sessions": concurrency,
+        # Sessions that kept up with the recording: nothing throttled, failed or skipped
+        "healthy": sum(1 for s in results if not (s["throttled"] or s["errors"] or s["dropped"])),
+        "seconds": wall,
+        "ok": sum(s["ok"] for s in results),
+        "throttled": sum(s["throttled"] for s in results),
+        "errors": sum(s["errors"] for s in results),
+        "dropped": sum(s["dropped"] for s in results),
+        "fps": sum(s["ok"] for s in results) / wall if wall else 0.0,
+        "p50Ms": _ms(percentile(all_latencies, 0.50)),
+        "p95Ms": _ms(percentile(all_latencies, 0.95)),
+        "p99Ms": _ms(percentile(all_latencies, 0.99)),
+    }
+    return results, summary
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
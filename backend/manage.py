@@ -1,3 +1,4 @@
+import os
 import click
 from app import app, db, ClothingItem # Import your Flask app, db instance, and models
 from init_db import init_db
@@ -164,5 +165,105 @@ def seed_db_command(force):
         except Exception as e:
             click.echo(f"Error seeding database: {e}", err=True)
 
+@cli.command("video-tryon")
+@click.option('--input', 'input_path', required=True, type=click.Path(exists=True, dir_okay=False), help="Video file to process.")
+@click.option('--item-id', required=True, type=int, help="ID of the clothing item to try on.")
+@click.option('--output', 'output_path', required=True, type=click.Path(dir_okay=False), help="Where to write the resulting .mp4.")
+def video_tryon_command(input_path, item_id, output_path):
+    """Renders a try-on video from a local clip using the live compositing pipeline."""
+    from app import get_garment_template
+    from video_tryon import process_video, VideoTryOnError
+
+    with app.app_context():
+        item = ClothingItem.query.get(item_id)
+        if not item or not item.imageUrl:
+            click.echo(f"Error: Item with ID {item_id} not found or missing imageUrl.", err=True)
+            return
+        try:
+            _, template = get_garment_template(item)
+
+            def progress(frames):
+                if frames % 100 == 0:
+                    click.echo(f"  {frames} frames...")
+
+            stats = process_video(input_path, output_path, template, progress=progress)
+            click.echo(
+                f"Wrote {output_path}: {stats['frames']} frames in {stats['seconds']:.1f}s "
+                f"({stats['fps']:.1f} fps, {stats['framesWithoutPose']} without a detected pose)"
+            )
+        except VideoTryOnError as e:
+            click.echo(f"Error: {e}", err=True)
+        except Exception as e:
+            click.echo(f"Error processing video: {e}", err=True)
+
+@cli.command("replay-sessions")
+@click.argument('recordings', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--url', default="http://127.0.0.1:5000", show_default=True, help="Backend to replay against.")
+@click.option('--sessions', 'concurrency', default=1, show_default=True, type=int, help="Number of sessions to replay concurrently (recordings are reused round-robin).")
+@click.option('--speed', default=1.0, show_default=True, type=float, help="Frame-rate multiplier relative to the recording.")
+@click.option('--item-id', default=1, show_default=True, type=int, help="clothingItemId for frames recorded without one.")
+@click.option('--shared-source', is_flag=True, help="Send every session from the same address instead of one 127.0.0.x per session.")
+@click.option('--server-cores', type=int, help="CPU cores of the server under test; enables the sessions-per-core figure.")
+def replay_sessions_command(recordings, concurrency, speed, item_id, shared_source, server_cores):
+    """Replays recorded live sessions (LIVE_RECORD_DIR) against a backend and reports capacity."""
+    from loadgen import load_recordings, replay_sessions
+
+    try:
+        # Fragments of one session recorded by different workers are merged back together
+        loaded = load_recordings(recordings)
+    except ValueError as e:
+        click.echo(f"Error: {e}", err=True)
+        return
+    if not loaded:
+        click.echo("Error: The recordings contain no frames.", err=True)
+        return
+
+    click.echo(f"Replaying {concurrency} session(s) from {len(loaded)} recording(s) at {speed}x against {url}")
+    per_session, summary = replay_sessions(
+        url, loaded, concurrency, speed=speed, default_item_id=item_id, distinct_sources=not shared_source
+    )
+
+    click.echo("\n--- Sessions ---")
+    for s in per_session:
+        click.echo(
+            f"#{s['session']} {s['recording']}: {s['fps']:.2f} fps, ok {s['ok']}/{s['sent']}, "
+            f"429s {s['throttled']}, errors {s['errors']}, dropped {s['dropped']}, "
+            f"p50 {s['p50Ms']} ms, p95 {s['p95Ms']} ms, p99 {s['p99Ms']} ms"
+        )
+    click.echo("\n--- Total ---")
+    click.echo(
+        f"{summary['sessions']} sessions in {summary['seconds']:.1f}s: {summary['fps']:.2f} fps, "
+        f"ok {summary['ok']}, 429s {summary['throttled']}, errors {summary['errors']}, dropped {summary['dropped']}"
+    )
+    click.echo(f"Latency p50 {summary['p50Ms']} ms, p95 {summary['p95Ms']} ms, p99 {summary['p99Ms']} ms")
+    if summary['healthy'] < summary['sessions']:
+        click.echo(f"{summary['sessions'] - summary['healthy']} session(s) were throttled, failed or dropped frames; "
+                   f"the server did not sustain {summary['sessions']} sessions at {speed}x")
+    elif server_cores:
+        click.echo(f"Sustained {summary['sessions']} sessions on {server_cores} core(s): "
+                   f"{summary['sessions'] / server_cores:.2f} sessions per core")
+
+@cli.command("serve")
+@click.option('--bind', default="0.0.0.0:5000", show_default=True, help="Address to listen on (host:port).")
+@click.option('--workers', default=lambda: os.cpu_count() or 1, type=int, help="Number of worker processes. Defaults to the CPU count.")
+@click.option('--threads', default=2, show_default=True, type=int, help="Request threads per worker (each gets its own warm pose model).")
+@click.option('--cpu-affinity', is_flag=True, help="Pin each worker to its own slice of CPUs (Linux only).")
+@click.option('--graceful-timeout', default=30, show_default=True, type=int, help="Seconds workers get to finish in-flight requests on shutdown.")
+@click.option('--timeout', default=60, show_default=True, type=int, help="Seconds before a silent worker is killed and replaced.")
+@click.option('--no-preload-catalog', is_flag=True, help="Skip downloading catalog garments before forking.")
+def serve_command(bind, workers, threads, cpu_affinity, graceful_timeout, timeout, no_preload_catalog):
+    """Runs the production server: preloads models once, then forks workers."""
+    from serve import run
+    click.echo(f"Starting {workers} worker(s) x {threads} thread(s) on {bind}")
+    run(
+        bind=bind,
+        workers=workers,
+        threads=threads,
+        graceful_timeout=graceful_timeout,
+        timeout=timeout,
+        cpu_affinity=cpu_affinity,
+        preload_catalog=not no_preload_catalog
+    )
+
 if __name__ == '__main__':
     cli()
\ No newline at end of file
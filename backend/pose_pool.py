@@ -0,0 +1,101 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+import mediapipe as mp
+
+# MediaPipe Pose settings for each kind of request.
+# Live frames come from many clients through the same pool, so tracking mode would
+# smooth landmarks across unrelated sessions; every frame is detected from scratch instead,
+# which is what a fresh per-request graph did anyway.
+POSE_CONFIGS = {
+    'photo': {
+        'static_image_mode': True,
+        'model_complexity': 1,
+        'enable_segmentation': False
+    },
+    'live': {
+        'static_image_mode': True,
+        'model_complexity': 0,       # Use lightweight model (0, 1, or 2)
+        'min_detection_confidence': 0.5
+    }
+}
+
+
+def torso_points(landmarks, w, h):
+    """
+    Pixel coordinates of the torso landmarks in garment anchor order:
+    image-left shoulder, image-right shoulder, image-left hip, image-right hip.
+    A person facing the camera has their right side on the image left.
+    """
+    pose_landmark = mp.solutions.pose.PoseLandmark
+    order = (pose_landmark.RIGHT_SHOULDER, pose_landmark.LEFT_SHOULDER,
+             pose_landmark.RIGHT_HIP, pose_landmark.LEFT_HIP)
+    return [(landmarks[i].x * w, landmarks[i].y * h) for i in order]
+
+
+class PosePool:
+    """
+    Reusable MediaPipe Pose graphs for one config. Building a graph costs far more
+    than running it on a frame, so graphs are checked out per request and returned.
+    MediaPipe graphs own threads and must not cross a fork; create pools in workers.
+    Args:
+        config: Keyword arguments for mp.solutions.pose.Pose
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new(self):
+        pose = mp.solutions.pose.Pose(**self.config)
+        with self._lock:
+            self._created += 1
+        return pose
+
+    @contextmanager
+    def acquire(self):
+        """Checks out a Pose graph for the enclosed block, building one if none is idle."""
+        try:
+            pose = self._idle.get_nowait()
+        except queue.Empty:
+            pose = self._new()
+        try:
+            yield pose
+        finally:
+            self._idle.put(pose)
+
+    def warm(self, count):
+        """Builds graphs until at least count are idle."""
+        while self._idle.qsize() < count:
+            self._idle.put(self._new())
+
+    def status(self):
+        return {"created": self._created, "idle": self._idle.qsize()}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(kind):
+    """Returns the PosePool for 'photo' or 'live' requests in this process."""
+    pool = _pools.get(kind)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(kind, PosePool(POSE_CONFIGS[kind]))
+    return pool
+
+def warm_all(count):
+    """Pre-builds count graphs of every kind, e.g. one per request thread."""
+    for kind in POSE_CONFIGS:
+        get_pool(kind).warm(count)
+
+def status():
+    return {kind: get_pool(kind).status() for kind in POSE_CONFIGS}
+
+def reset():
+    """Drops every pool; used in freshly forked workers so no graph crosses the fork."""
+    with _pools_lock:
+        _pools.clear()
@@ -0,0 +1,159 @@
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_ID = re.compile(r'^[0-9a-f]{16}$')
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+class RouteProfiler:
+    """
+    On-demand sampling profiler for one Flask endpoint. While a profile runs, the
+    endpoint's view function is swapped for a wrapper that marks which threads are
+    serving it, and a background thread samples those threads' stacks at a fixed
+    interval. Nothing is installed while no profile is running, so it costs nothing
+    when off.
+    Args:
+        app: Flask application whose view functions are profiled
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._running = threading.Lock()
+
+    def start(self, endpoint, on_done, max_requests=None, max_seconds=30.0, interval=0.005):
+        """
+        Profiles the next max_requests requests to endpoint, or everything it serves
+        for max_seconds, whichever ends first. Samples on a background thread and
+        returns at once, so no request thread is tied up for the length of the profile.
+        Args:
+            endpoint: Flask endpoint name (e.g. 'process_live_tryon')
+            on_done: Called on the sampling thread with (Counter of collapsed stack ->
+                samples, dict with requests, samples and seconds), or with
+                (None, {"error": message}) if profiling failed
+            max_requests: Stop after this many requests have completed (None: time only)
+            max_seconds: Stop after this long regardless
+            interval: Seconds between samples
+        Raises:
+            ProfilerBusy: If another profile is running in this process
+        """
+        if not self._running.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+
+        def run():
+            try:
+                result = self._profile(endpoint, max_requests, max_seconds, interval)
+            except Exception as e:
+                result = (None, {"error": str(e)})
+            finally:
+                self._running.release()
+            on_done(*result)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _profile(self, endpoint, max_requests, max_seconds, interval):
+        original = self.app.view_functions[endpoint]
+        active = set()
+        lock = threading.Lock()
+        done = threading.Event()
+        completed = [0]
+
+        @functools.wraps(original)
+        def profiled_view(*args, **kwargs):
+            thread_id = threading.get_ident()
+            with lock:
+                active.add(thread_id)
+            try:
+                return original(*args, **kwargs)
+            finally:
+                with lock:
+                    active.discard(thread_id)
+                    completed[0] += 1
+                    if max_requests and completed[0] >= max_requests:
+                        done.set()
+
+        stacks = Counter()
+        samples = 0
+        start = time.time()
+        self.app.view_functions[endpoint] = profiled_view
+        try:
+            while not done.is_set() and time.time() - start < max_seconds:
+                with lock:
+                    thread_ids = list(active)
+                if thread_ids:
+                    frames = sys._current_frames()
+                    for thread_id in thread_ids:
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            stacks[_collapse(frame, profiled_view.__code__)] += 1
+                            samples += 1
+                done.wait(interval)
+        finally:
+            # Only undo our own wrapper, in case the view was replaced meanwhile
+            if self.app.view_functions.get(endpoint) is profiled_view:
+                self.app.view_functions[endpoint] = original
+
+        return stacks, {"requests": completed[0], "samples": samples, "seconds": round(time.time() - start, 3)}
+
+
+def _collapse(frame, stop_code):
+    """
+    Formats a stack as 'file:function;file:function;...' from the view down to the
+    leaf, leaving out the WSGI/Flask frames below the profiling wrapper.
+    """
+    names = []
+    while frame is not None and frame.f_code is not stop_code:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def to_collapsed(stacks):
+    """Collapsed-stack text ('stack count' per line), as read by flamegraph.pl and speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def save_profile(directory, profile_id, record):
+    """Writes a profile's state (running or finished) where every worker process can read it."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{profile_id}.json")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(record, f)
+    os.replace(temp_path, path)
+
+
+def prune_profiles(directory, keep=20):
+    """Deletes all but the `keep` most recently written profiles."""
+    try:
+        paths = sorted(
+            (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")),
+            key=os.path.getmtime
+        )
+        for path in paths[:-keep]:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def is_profile_id(value):
+    """Whether value looks like an id handed out for a profile (and is safe in a path)."""
+    return bool(PROFILE_ID.match(value))
+
+
+def load_profile(directory, profile_id):
+    """The saved state of a profile, or None if there is no such profile."""
+    try:
+        with open(os.path.join(directory, f"{profile_id}.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
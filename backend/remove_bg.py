@@ -1,6 +1,28 @@
-from rembg import remove
+from rembg import remove, new_session
 from PIL import Image
 import io
+import threading
+
+# rembg model used for garments; one ONNX session is shared by every thread in the process
+REMBG_MODEL = "u2net"
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the process-wide rembg session, creating it on first use.
+    Created in a pre-fork parent, the session's weights are shared copy-on-write by workers.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = new_session(REMBG_MODEL)
+    return _session
+
+def is_loaded():
+    return _session is not None
 
 def remove_background(pil_img):
     """
@@ -14,9 +36,9 @@ def remove_background(pil_img):
     img_byte_arr = io.BytesIO()
     pil_img.save(img_byte_arr, format='PNG')
     img_byte_arr = img_byte_arr.getvalue()
-    
+
     # Remove background
-    output = remove(img_byte_arr)
-    
+    output = remove(img_byte_arr, session=get_session())
+
     # Convert back to PIL Image
-    return Image.open(io.BytesIO(output)) 
\ No newline at end of file
+    return Image.open(io.BytesIO(output))
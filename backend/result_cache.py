@@ -0,0 +1,64 @@
+import hashlib
+import os
+import re
+import threading
+
+# Bump whenever compositing output changes (warp, blending, encoding) so results
+# rendered by an older pipeline are never served for new requests
+PIPELINE_VERSION = "affine-warp-1"
+
+# Files whose name is derived from their content never change and can be cached forever
+IMMUTABLE_NAME = re.compile(r'^(?:tryon|user)_([0-9a-f]{32,64})\.(?:png|jpg)$')
+
+# One year, the conventional "forever" for immutable assets
+IMMUTABLE_MAX_AGE = 31536000
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file's content. Remembered per (path, mtime, size), so an
+    unchanged file is only read once per process and a replaced one is re-hashed.
+    """
+    stat = os.stat(path)
+    signature = (path, stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        digest = _digests.get(signature)
+    if digest is not None:
+        return digest
+
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    with _digests_lock:
+        if len(_digests) > 10000:
+            _digests.clear()
+        _digests[signature] = digest
+    return digest
+
+
+def result_filename(user_digest, garment_digest):
+    """Deterministic name of the try-on result for these inputs under the current pipeline."""
+    key = hashlib.sha256(f"{user_digest}:{garment_digest}:{PIPELINE_VERSION}".encode()).hexdigest()
+    return f"tryon_{key[:40]}.png"
+
+
+def immutable_etag(filename):
+    """The content hash embedded in an immutable file name, or None for other files."""
+    match = IMMUTABLE_NAME.match(filename)
+    return match.group(1) if match else None
+
+
+def save_atomic(pil_img, path, **save_args):
+    """Saves an image under a temporary name and renames it, so readers never see a partial file."""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        pil_img.save(temp_path, **save_args)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
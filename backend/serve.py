@@ -0,0 +1,115 @@
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+def cpu_slice(slot, workers, cpus):
+    """
+    CPUs the worker in a given slot should be pinned to: the available CPUs split
+    into contiguous slices, one per slot, with any remainder spread one extra CPU
+    per slot so no CPU is left out. With more workers than CPUs, slots share CPUs
+    round-robin. Slots beyond the worker count (e.g. while a reload overlaps old
+    and new workers) wrap around, and the result is never empty.
+    """
+    cpus = sorted(cpus)
+    workers = max(1, workers)
+    slot %= workers
+    if workers >= len(cpus):
+        return {cpus[slot % len(cpus)]}
+    per_slot, extra = divmod(len(cpus), workers)
+    start = slot * per_slot + min(slot, extra)
+    return set(cpus[start:start + per_slot + (1 if slot < extra else 0)]) or set(cpus)
+
+
+class TryOnServer(BaseApplication):
+    """
+    Preforking gunicorn server for the Flask app. Models are loaded once in the
+    parent (preload_app) and shared copy-on-write by workers; catalog garments are
+    published to the asset store, which every worker maps read-only.
+    Args:
+        options: gunicorn settings (bind, workers, threads, graceful_timeout, ...)
+        cpu_affinity: Pin each worker to its own slice of CPUs
+        preload_catalog: Publish missing catalog garments to the asset store before forking
+    """
+
+    def __init__(self, options, cpu_affinity=False, preload_catalog=True):
+        self.options = options
+        self.cpu_affinity = cpu_affinity and hasattr(os, "sched_setaffinity")
+        self.preload_catalog = preload_catalog
+        self.cpus = sorted(os.sched_getaffinity(0)) if self.cpu_affinity else []
+        self.slots = {}  # worker.age (unique per spawn) -> slot, kept in the parent
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set("preload_app", True)
+        self.cfg.set("pre_fork", self.pre_fork)
+        self.cfg.set("post_fork", self.post_fork)
+        self.cfg.set("child_exit", self.child_exit)
+        self.cfg.set("worker_exit", self.worker_exit)
+
+    def load(self):
+        # Runs once in the parent before any worker is forked
+        import remove_bg
+        from app import app, preload_catalog_assets
+
+        # Must be single-threaded so no ONNX thread pool exists when workers fork
+        remove_bg.get_session()
+        if self.preload_catalog:
+            preload_catalog_assets()
+        # Lets admin tools such as the profiler say how much of the traffic they see
+        app.config['SERVER_WORKERS'] = self.cfg.workers
+        app.logger.info("Models preloaded, forking workers")
+        return app
+
+    def pre_fork(self, server, worker):
+        # Runs in the parent: a replacement worker takes over the lowest slot a dead
+        # worker freed, so it gets that worker's CPUs instead of doubling up on others
+        taken = set(self.slots.values())
+        worker.slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+        self.slots[worker.age] = worker.slot
+
+    def child_exit(self, server, worker):
+        # Runs in the parent once a worker has exited, freeing its slot
+        self.slots.pop(worker.age, None)
+
+    def worker_exit(self, server, worker):
+        # Normally runs in the exiting worker (a no-op there), but gunicorn also calls it
+        # in the parent instead of child_exit for workers that vanished unnoticed
+        self.slots.pop(worker.age, None)
+
+    def post_fork(self, server, worker):
+        import cv2
+        import pose_pool
+
+        threads = self.cfg.threads
+        if self.cpu_affinity:
+            # The live worker count follows TTIN/TTOU; cfg.workers does not
+            cpus = cpu_slice(worker.slot, server.num_workers, self.cpus)
+            os.sched_setaffinity(0, cpus)
+            worker.log.info(f"Worker {worker.pid} (slot {worker.slot}) pinned to CPUs {sorted(cpus)}")
+        cv2.setNumThreads(threads)
+
+        # MediaPipe graphs own threads, so they are built here rather than in the parent:
+        # one per request thread and kind, ready before the worker accepts connections
+        pose_pool.reset()
+        pose_pool.warm_all(threads)
+        worker.log.info(f"Worker {worker.pid} warmed {threads} pose graph(s) per kind")
+
+
+def run(bind, workers, threads, graceful_timeout, timeout, cpu_affinity, preload_catalog):
+    """Starts the preforking server and blocks until it is shut down (SIGTERM/SIGINT)."""
+    # rembg reads this when creating its ONNX session; one intra-op thread keeps the
+    # parent free of thread pools at fork time. Parallelism comes from workers and threads.
+    os.environ["OMP_NUM_THREADS"] = "1"
+
+    options = {
+        "bind": bind,
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "graceful_timeout": graceful_timeout,
+        "timeout": timeout,
+    }
+    TryOnServer(options, cpu_affinity=cpu_affinity, preload_catalog=preload_catalog).run()
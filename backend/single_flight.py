@@ -0,0 +1,70 @@
+import threading
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Raised to a waiting caller when the in-flight call doesn't finish in time."""
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the work,
+    callers arriving while it runs wait for and share its result (or exception).
+    Nothing is remembered once the call finishes; pair it with a cache.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Runs fn() for key unless a call for key is already in flight, in which
+        case waits for that call instead.
+        Args:
+            key: Hashable identifying the work
+            fn: Zero-argument callable doing the work
+            timeout: Seconds a waiting caller gives the in-flight call (None waits forever).
+                The caller that runs fn is never interrupted.
+        Returns:
+            The value returned by fn
+        Raises:
+            Whatever fn raised, in the leader and every waiting caller
+            SingleFlightTimeout: If a waiting caller gives up
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.value = fn()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+            return call.value
+
+        if not call.done.wait(timeout):
+            raise SingleFlightTimeout(f"Timed out after {timeout}s waiting for in-flight call {key!r}")
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    def in_flight(self):
+        """Number of keys currently being worked on."""
+        with self._lock:
+            return len(self._calls)
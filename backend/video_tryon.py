@@ -0,0 +1,183 @@
+import queue
+import threading
+import time
+
+import cv2
+import mediapipe as mp
+
+from garment_warp import live_transform, warp_onto
+from pose_pool import torso_points
+
+# Frames a stage may get ahead of the next one. Memory use is bounded by
+# (number of queues x QUEUE_SIZE) frames whatever the length of the clip.
+QUEUE_SIZE = 8
+
+# Unlike live frames, one clip is one person, so tracking mode with smoothing is safe here
+VIDEO_POSE_CONFIG = {
+    'static_image_mode': False,
+    'model_complexity': 0,
+    'smooth_landmarks': True,
+    'min_detection_confidence': 0.5,
+    'min_tracking_confidence': 0.5
+}
+
+# Output codecs in order of preference: H.264 plays in browsers but needs an OpenCV
+# build with an H.264 encoder; mp4v (MPEG-4 Part 2) ships with every build
+OUTPUT_FOURCCS = ('avc1', 'mp4v')
+
+# Marks the end of the stream on every queue
+_END = object()
+
+
+class VideoTryOnError(Exception):
+    """Raised when the input video can't be read or the output can't be written."""
+
+
+class _Pipeline:
+    """Threads and bounded queues shared by the stages of one video job."""
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.errors = []
+
+    def put(self, q, item):
+        # Retry with a timeout so a stage blocked on a full queue notices a stop request
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def run_stage(self, target, *args):
+        def wrapper():
+            try:
+                target(*args)
+            except Exception as e:
+                self.errors.append(e)
+                self.stop.set()
+        thread = threading.Thread(target=wrapper, daemon=True)
+        thread.start()
+        return thread
+
+
+def process_video(input_path, output_path, template, progress=None):
+    """
+    Composites a garment onto every frame of a video. Decode, pose tracking,
+    compositing and encode each run in their own thread, connected by bounded
+    queues, so decode and encode overlap with inference.
+    Args:
+        input_path: Path of the source video
+        output_path: Path of the .mp4 file to write
+        template: GarmentTemplate of the garment to overlay
+        progress: Optional callable(frames_done) called after each encoded frame
+    Returns:
+        dict with frames, framesWithoutPose, codec, seconds and fps (frames processed per second)
+    Raises:
+        VideoTryOnError: If the video can't be opened or written, or has no decodable frames
+    """
+    capture = cv2.VideoCapture(input_path)
+    if not capture.isOpened():
+        raise VideoTryOnError(f"Could not open video '{input_path}'")
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    source_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    writer, codec = _open_writer(output_path, source_fps, (width, height))
+    if writer is None:
+        capture.release()
+        raise VideoTryOnError(f"Could not open '{output_path}' for writing")
+
+    pipeline = _Pipeline()
+    decoded = queue.Queue(maxsize=QUEUE_SIZE)
+    posed = queue.Queue(maxsize=QUEUE_SIZE)
+    composited = queue.Queue(maxsize=QUEUE_SIZE)
+    stats = {"frames": 0, "framesWithoutPose": 0, "codec": codec}
+
+    def decode():
+        while not pipeline.stop.is_set():
+            ok, frame_bgr = capture.read()
+            if not ok:
+                break
+            # MediaPipe and the garment template are both RGB
+            if not pipeline.put(decoded, cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)):
+                return
+        pipeline.put(decoded, _END)
+
+    def track():
+        with mp.solutions.pose.Pose(**VIDEO_POSE_CONFIG) as pose:
+            while True:
+                frame = pipeline.get(decoded)
+                if frame is _END:
+                    break
+                results = pose.process(frame)
+                points = torso_points(results.pose_landmarks.landmark, width, height) if results.pose_landmarks else None
+                if not pipeline.put(posed, (frame, points)):
+                    return
+        pipeline.put(posed, _END)
+
+    def composite():
+        matrix = None
+        while True:
+            item = pipeline.get(posed)
+            if item is _END:
+                break
+            frame, points = item
+            if points is not None:
+                matrix, _ = live_transform(template, points, width, height)
+            else:
+                # Keep the garment where it was last seen rather than flickering off
+                stats["framesWithoutPose"] += 1
+            if matrix is not None:
+                warp_onto(frame, template, matrix)
+            if not pipeline.put(composited, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)):
+                return
+        pipeline.put(composited, _END)
+
+    start = time.time()
+    threads = [pipeline.run_stage(stage) for stage in (decode, track, composite)]
+    try:
+        # Encode on the calling thread
+        while True:
+            frame_bgr = pipeline.get(composited)
+            if frame_bgr is _END:
+                break
+            writer.write(frame_bgr)
+            stats["frames"] += 1
+            if progress:
+                progress(stats["frames"])
+    finally:
+        pipeline.stop.set()
+        for thread in threads:
+            thread.join()
+        capture.release()
+        writer.release()
+
+    if pipeline.errors:
+        raise pipeline.errors[0]
+    if stats["frames"] == 0:
+        raise VideoTryOnError(f"No frames could be decoded from '{input_path}'")
+
+    seconds = time.time() - start
+    stats["seconds"] = round(seconds, 3)
+    stats["fps"] = round(stats["frames"] / seconds, 2) if seconds > 0 else 0.0
+    return stats
+
+
+def _open_writer(output_path, fps, size):
+    """Opens a writer with the first available codec. Returns (writer, fourcc) or (None, None)."""
+    for fourcc in OUTPUT_FOURCCS:
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        if writer.isOpened():
+            return writer, fourcc
+        writer.release()
+    return None, None
@@ -3,6 +3,14 @@ import './LiveTryOn.css';
 
 const BACKEND_URL = "http://127.0.0.1:5000";
 
+// Capture settings used until the server sends its first quality hint
+const DEFAULT_QUALITY_HINT = {
+  captureWidth: 640,
+  captureHeight: 480,
+  jpegQuality: 0.8,
+  frameIntervalMs: 400
+};
+
 function LiveTryOn({ catalog, selectedTryOnItem }) {
   const videoRef = useRef(null);
   const canvasRef = useRef(null);
@@ -12,6 +20,8 @@ function LiveTryOn({ catalog, selectedTryOnItem }) {
   const [processingFrame, setProcessingFrame] = useState(false);
   const [showConsent, setShowConsent] = useState(false); // Changed to false to skip consent screen initially
   const animationFrameRef = useRef(null);
+  const qualityHintRef = useRef(DEFAULT_QUALITY_HINT); // Latest load-aware hint from the server
+  const frameSentAtRef = useRef(0);
   
   // Function to start the webcam
   const startWebcam = async () => {
@@ -104,11 +114,15 @@ function LiveTryOn({ catalog, selectedTryOnItem }) {
     const ctx = canvasRef.current.getContext('2d');
     const video = videoRef.current;
     
-    // Set canvas dimensions to match video
-    if (canvasRef.current.width !== video.videoWidth || canvasRef.current.height !== video.videoHeight) {
-      console.log(`Setting canvas dimensions to ${video.videoWidth}x${video.videoHeight}`);
-      canvasRef.current.width = video.videoWidth;
-      canvasRef.current.height = video.videoHeight;
+    // Set canvas dimensions to the video size, scaled down to fit the server's hint
+    const hint = qualityHintRef.current;
+    const scale = Math.min(1, hint.captureWidth / video.videoWidth, hint.captureHeight / video.videoHeight);
+    const captureWidth = Math.round(video.videoWidth * scale);
+    const captureHeight = Math.round(video.videoHeight * scale);
+    if (canvasRef.current.width !== captureWidth || canvasRef.current.height !== captureHeight) {
+      console.log(`Setting canvas dimensions to ${captureWidth}x${captureHeight}`);
+      canvasRef.current.width = captureWidth;
+      canvasRef.current.height = captureHeight;
     }
     
     // Draw the video frame to canvas
@@ -128,6 +142,7 @@ function LiveTryOn({ catalog, selectedTryOnItem }) {
           
           // Send to the server for processing
           try {
+            frameSentAtRef.current = performance.now();
             const response = await fetch(`${BACKEND_URL}/api/live-tryon`, { 
               method: 'POST',
               body: formData
@@ -135,10 +150,17 @@ function LiveTryOn({ catalog, selectedTryOnItem }) {
             
             if (!response.ok) {
               const errorData = await response.json();
+              // Back off as the server asks even when it rejects the frame
+              if (errorData.qualityHint) {
+                qualityHintRef.current = errorData.qualityHint;
+              }
               throw new Error(errorData.error || `Server error: ${response.status}`);
             }
             
             const result = await response.json();
+            if (result.qualityHint) {
+              qualityHintRef.current = result.qualityHint;
+            }
             
             // Draw the result image on canvas
             if (result.resultImageUrl) {
@@ -147,10 +169,11 @@ function LiveTryOn({ catalog, selectedTryOnItem }) {
                 ctx.drawImage(resultImage, 0, 0, canvasRef.current.width, canvasRef.current.height);
                 setProcessingFrame(false);
                 
-                // Continue with next frame after a short delay to avoid overwhelming the server
+                // Continue with next frame once the interval suggested by the server has passed
+                const elapsed = performance.now() - frameSentAtRef.current;
                 setTimeout(() => {
                   animationFrameRef.current = requestAnimationFrame(processFrame);
-                }, 250); // Longer delay for real server processing
+                }, Math.max(0, qualityHintRef.current.frameIntervalMs - elapsed));
               };
               resultImage.onerror = () => {
                 console.error("Failed to load result image");
@@ -166,9 +189,11 @@ function LiveTryOn({ catalog, selectedTryOnItem }) {
           } catch (error) {
             console.error("Error processing try-on request:", error);
             setProcessingFrame(false);
-            animationFrameRef.current = requestAnimationFrame(processFrame);
+            setTimeout(() => {
+              animationFrameRef.current = requestAnimationFrame(processFrame);
+            }, qualityHintRef.current.frameIntervalMs);
           }
-        }, 'image/jpeg', 0.8); // Convert canvas to JPEG for reduced size
+        }, 'image/jpeg', qualityHintRef.current.jpegQuality); // Convert canvas to JPEG at the hinted quality
       } catch (err) {
         console.error("Error processing frame:", err);
         setProcessingFrame(false);